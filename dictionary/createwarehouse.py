@@ -1,67 +1,41 @@
 import os
 import sys
-from pathlib import Path
 
 # Add the root of the project to the system path to resolve imports from the pipeline module
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from pipeline.constants import SINGLE_PATH_ASSETS_PATHS, PARTITIONED_ASSETS_PATHS, WAREHOUSE_PATH
-from pipeline.utils.duckdb_wrapper import DuckDBWrapper
+from pipeline.constants import (
+    SINGLE_PATH_ASSETS_PATHS,
+    PARTITIONED_ASSETS_PATHS,
+    WAREHOUSE_PATH,
+    LAKE_PATH,
+    LAKE_CATALOG_PATH,
+    DBT_MODELS_PATH,
+    WAREHOUSE_MATERIALIZATIONS,
+)
+from pipeline.utils.lake_catalog import LakeCatalog
+from pipeline.utils.warehouse_builder import reconcile_warehouse, warehouse_sources
 
 def create_duckdb_and_views():
     """
-    Creates a persistent DuckDB file at WAREHOUSE_PATH and registers each
-    asset as a DuckDB view. Handles both single-path and partitioned assets.
-    Creates the directory and database if they don't exist, and replaces
-    any existing DuckDB file with a new one.
+    Brings the persistent DuckDB file at WAREHOUSE_PATH in sync with the lake,
+    registering each asset as a DuckDB view or native table. Handles both single-path and
+    partitioned assets. Same logic as the duckdb_warehouse asset: the file is
+    kept, and only assets whose files changed are re-registered.
     """
-    # Ensure WAREHOUSE_PATH directory exists
-    warehouse_dir = Path(WAREHOUSE_PATH).parent
-    warehouse_dir.mkdir(parents=True, exist_ok=True)
-
-    # If a DuckDB file exists at WAREHOUSE_PATH, delete it
-    if os.path.exists(WAREHOUSE_PATH):
-        print(f"Existing DuckDB file at {WAREHOUSE_PATH} deleted.")
-        os.remove(WAREHOUSE_PATH)
-
-    # Create new DuckDB connection using DuckDBWrapper
-    duckdb_wrapper = DuckDBWrapper(WAREHOUSE_PATH)
-    print(f"New DuckDB file created at {WAREHOUSE_PATH}")
-
-    # Register non-partitioned assets
-    non_partitioned = {**SINGLE_PATH_ASSETS_PATHS}
-    if non_partitioned:
-        table_names = list(non_partitioned.keys())
-        repo_root = os.path.dirname(WAREHOUSE_PATH)  # Use the warehouse's parent dir as repo_root
-        base_path = os.path.relpath(os.path.dirname(list(non_partitioned.values())[0]), repo_root)
-        duckdb_wrapper.bulk_register_data(
-            repo_root=repo_root,
-            base_path=base_path,
-            table_names=table_names,
-            wildcard="*.parquet",
-            as_table=False,  # Register as views
-            show_tables=False
-        )
-
-    # Register partitioned assets
-    partitioned = {**PARTITIONED_ASSETS_PATHS}
-    if partitioned:
-        table_names = list(partitioned.keys())
-        repo_root = os.path.dirname(WAREHOUSE_PATH)  # Use the warehouse's parent dir as repo_root
-        base_path = os.path.relpath(os.path.dirname(list(partitioned.values())[0]), repo_root)
-        duckdb_wrapper.bulk_register_partitioned_data(
-            repo_root=repo_root,
-            base_path=base_path,
-            table_names=table_names,
-            wildcard="year=*/month=*/*.parquet",
-            as_table=False,  # Register as views
-            show_tables=False
-        )
-
-    # Close the connection
-    duckdb_wrapper.con.close()
-    print("Connection to DuckDB closed.")
+    sources = warehouse_sources(
+        SINGLE_PATH_ASSETS_PATHS,
+        PARTITIONED_ASSETS_PATHS,
+        repo_root=os.path.dirname(WAREHOUSE_PATH),  # Use the warehouse's parent dir as repo_root
+        materializations=WAREHOUSE_MATERIALIZATIONS,
+    )
+    reconcile_warehouse(
+        WAREHOUSE_PATH,
+        sources,
+        catalog=LakeCatalog(LAKE_PATH, LAKE_CATALOG_PATH),
+        sql_dirs=[DBT_MODELS_PATH, os.path.dirname(WAREHOUSE_PATH)],  # dbt models and Evidence source queries
+    )
 
 if __name__ == "__main__":
-    # Call the function to create the DuckDB file and views
-    create_duckdb_and_views()
\ No newline at end of file
+    # Call the function to create or update the DuckDB file and views
+    create_duckdb_and_views()
@@ -1,17 +1,90 @@
 # pipeline/assets/ingestion/mta_assets.py
 
 import os
-import gc
 import requests
 import polars as pl
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # Replace MaterializeResult with Output
-from dagster import asset, Output, MetadataValue
+from dagster import asset, Output, MaterializeResult, MetadataValue, MonthlyPartitionsDefinition
 
+from pipeline.constants import LAKE_PATH, STAGING_PATH
 from pipeline.resources.socrata_resource import SocrataResource
+from pipeline.resources.io_managers.single_file_polars_parquet_io_manager import single_file_parquet_path
+from pipeline.utils.dtype_optimization import storage_dtype_names
+from pipeline.utils.incremental import read_high_water_mark
+from pipeline.utils.lake_catalog import LakeCatalog
+from pipeline.utils.parquet_compaction import compact_partition, recover_partition
+from pipeline.utils.parquet_page_writer import ParquetPageWriter, checkpoint_fingerprint
+from pipeline.utils.staged_ingestion import run_staged_ingestion, socrata_page_transform
 from .processing.mta_processing import *
 
+
+class MTADailyRidershipConstants:
+    ENDPOINT = "https://data.ny.gov/resource/vxuj-8kew.json"
+    START_DATE = "2020-03-01T00:00:00"
+    PAGE_SIZE = 50000
+    PAGINATION = "concurrent"  # "offset", "concurrent" or "keyset"
+    MAX_WORKERS = 4
+    KEYSET_KEY = "date"
+    RESPONSE_FORMAT = "csv"  # "csv" (native Polars reader) or "json" (fallback)
+    CSV_SCHEMA = MTA_DAILY_CSV_SCHEMA
+    PARSE_WORKERS = 2        # Processes decoding and transforming pages
+    MAX_IN_FLIGHT_PAGES = 8  # Pages in memory across fetch, transform and write; at least MAX_WORKERS + 2
+    INCREMENTAL = True  # Only fetch rows past the max date already stored
+    OVERLAP_DAYS = 7    # Re-fetch this many days before the stored max to pick up late corrections
+
+
+class MTAOperationsStatementConstants:
+    ENDPOINT = "https://data.ny.gov/resource/yg77-3tkj.json"
+    PAGE_SIZE = 50000
+    PAGINATION = "concurrent"  # "offset", "concurrent" or "keyset"
+    MAX_WORKERS = 4
+    KEYSET_KEY = "month"
+    RESPONSE_FORMAT = "csv"  # "csv" (native Polars reader) or "json" (fallback)
+    CSV_SCHEMA = MTA_OPERATIONS_STATEMENT_CSV_SCHEMA
+    PARSE_WORKERS = 2        # Processes decoding and transforming pages
+    MAX_IN_FLIGHT_PAGES = 8  # Pages in memory across fetch, transform and write; at least MAX_WORKERS + 2
+
+
+class MTASubwayHourlyRidershipConstants:
+    START_DATE = "2022-03-01"  # First month published on fastopendata
+    SCHEDULE_DAY_OF_MONTH = 5  # Give the source a few days to publish the month that just ended
+    SCHEDULE_HOUR_OF_DAY = 2
+    COMPACTION_SORT_BY = ["station_complex_id", "transit_timestamp"]  # Row-group min/max pruning on station and time
+    COMPACTION_ROWS_PER_FILE = 10_000_000
+    COMPACTION_ROW_GROUP_SIZE = 122_880  # Matches DuckDB's row group size
+
+
+# One partition per month. end_offset=0 means the newest partition is the last
+# complete month, so the current month never runs half-published.
+mta_subway_hourly_ridership_partitions = MonthlyPartitionsDefinition(
+    start_date=MTASubwayHourlyRidershipConstants.START_DATE,
+    end_offset=0,
+)
+
+
+def _socrata_fetch_buffer(constants) -> int:
+    """
+    Pages SocrataResource.iter_pages holds at once: concurrent pagination keeps
+    MAX_WORKERS requests running ahead, the sequential modes one page.
+    """
+    return constants.MAX_WORKERS if constants.PAGINATION == "concurrent" else 1
+
+
+def _socrata_query_fingerprint(constants, params: dict) -> str:
+    """
+    Identify a paged Socrata pull by everything that decides which rows land on which page.
+    """
+    return checkpoint_fingerprint(
+        endpoint=constants.ENDPOINT,
+        params=params,
+        page_size=constants.PAGE_SIZE,
+        pagination=constants.PAGINATION,
+        key=constants.KEYSET_KEY,
+        response_format=constants.RESPONSE_FORMAT,
+    )
+
 @asset(
     name="mta_daily_ridership",
     compute_kind="Polars",
@@ -19,48 +92,90 @@ from .processing.mta_processing import *
     group_name="MTA",
     tags={"domain": "mta", "type": "ingestion", "source": "socrata"},
     metadata={
-        "data_url": MetadataValue.url("https://data.ny.gov/Transportation/MTA-Daily-Ridership-Data-2020-2025/vxuj-8kew/about_data")
+        "data_url": MetadataValue.url("https://data.ny.gov/Transportation/MTA-Daily-Ridership-Data-2020-2025/vxuj-8kew/about_data"),
+        "storage_dtypes": storage_dtype_names(storage_dtypes(MTA_DAILY_COLUMNS)),
     }
 )
 def mta_daily_ridership(context, socrata: SocrataResource):
-    endpoint = "https://data.ny.gov/resource/vxuj-8kew.json"
-    limit = 500000
-    offset = 0
+    file_path = single_file_parquet_path(LAKE_PATH, "mta_daily_ridership")
+    start_date = MTADailyRidershipConstants.START_DATE
+
+    high_water_mark = None
+    refetch_from = None
+    if MTADailyRidershipConstants.INCREMENTAL:
+        high_water_mark = read_high_water_mark(file_path, "date")
+    if high_water_mark is not None:
+        refetch_from = high_water_mark - timedelta(days=MTADailyRidershipConstants.OVERLAP_DAYS)
+        start_date = max(start_date, refetch_from.strftime("%Y-%m-%dT00:00:00"))
+        context.log.info(f"[mta_daily] Stored data runs to {high_water_mark}, fetching from {start_date}")
+
+    params = {
+        "$order": "Date ASC",
+        "$where": f"Date >= '{start_date}'",
+    }
+
+    # Completed pages are checkpointed, so a failed pull of the same query resumes after its last page
+    writer = ParquetPageWriter(
+        os.path.join(STAGING_PATH, "mta_daily_ridership"),
+        fingerprint=_socrata_query_fingerprint(MTADailyRidershipConstants, params),
+    )
+    if writer.resumed:
+        context.log.info(
+            f"[mta_daily] Resuming from checkpoint: {len(writer.part_paths)} parts, cursor {writer.cursor}"
+        )
+    elif refetch_from is not None:
+        # Stored rows before the overlap window are carried over as the first part
+        writer.write_lazy(pl.scan_parquet(file_path).filter(pl.col("date") < refetch_from))
 
-    frames = []
     last_orig_cols = []
     last_renamed_cols = []
     date_sample = "N/A"
 
-    while True:
-        params = {
-            "$limit": limit,
-            "$offset": offset,
-            "$order": "Date ASC",
-            "$where": "Date >= '2020-03-01T00:00:00'",
-        }
-        data = socrata.fetch_data(endpoint, params)
-        if not data:
-            context.log.info(f"[mta_daily] No more data at offset {offset}")
-            break
-
-        df = pl.DataFrame(data)
-        processed_df, orig_cols, renamed_cols, date_sample = process_mta_daily_df(df)
-        frames.append(processed_df)
+    pages = socrata.iter_pages(
+        MTADailyRidershipConstants.ENDPOINT,
+        params,
+        page_size=MTADailyRidershipConstants.PAGE_SIZE,
+        pagination=MTADailyRidershipConstants.PAGINATION,
+        max_workers=MTADailyRidershipConstants.MAX_WORKERS,
+        key=MTADailyRidershipConstants.KEYSET_KEY,
+        response_format=MTADailyRidershipConstants.RESPONSE_FORMAT,
+        schema=MTADailyRidershipConstants.CSV_SCHEMA,
+        decode=False,  # Pages are decoded in the transform stage
+        start_cursor=writer.cursor,
+        with_cursor=True,
+    )
+    processed_pages = run_staged_ingestion(
+        pages,
+        socrata_page_transform(
+            process_mta_daily_df,
+            response_format=MTADailyRidershipConstants.RESPONSE_FORMAT,
+            schema=MTADailyRidershipConstants.CSV_SCHEMA,
+        ),
+        parse_workers=MTADailyRidershipConstants.PARSE_WORKERS,
+        max_in_flight=MTADailyRidershipConstants.MAX_IN_FLIGHT_PAGES,
+        tagged=True,
+        fetch_buffer=_socrata_fetch_buffer(MTADailyRidershipConstants),
+    )
+    for page_num, (result, cursor) in enumerate(processed_pages, start=1):
+        processed_df, orig_cols, renamed_cols, date_sample = result
+        context.log.info(f"[mta_daily] Page {page_num}: {processed_df.height} rows")
+        writer.write_page(processed_df, cursor=cursor)
 
         last_orig_cols = orig_cols
         last_renamed_cols = renamed_cols
 
-        offset += limit
-        del df, processed_df, data
-        gc.collect()
-
-    final_df = pl.concat(frames, how="vertical") if frames else pl.DataFrame([])
+    fetched_rows = writer.page_row_count
+    if refetch_from is not None and fetched_rows == 0:
+        # Nothing came back, so keep the stored overlap window rather than dropping it
+        writer.write_lazy(pl.scan_parquet(file_path).filter(pl.col("date") >= refetch_from))
 
     return Output(
-        value=final_df,
+        value=writer,
         metadata={
-            "dagster/row_count": final_df.shape[0],
+            "dagster/row_count": writer.row_count,
+            "fetched_rows": fetched_rows,
+            "incremental": refetch_from is not None,
+            "high_water_mark": str(high_water_mark),
             "original_columns": str(last_orig_cols),
             "renamed_columns": str(last_renamed_cols),
             "date_col_sample": date_sample,
@@ -74,45 +189,64 @@ def mta_daily_ridership(context, socrata: SocrataResource):
     group_name="MTA",
     tags={"domain": "mta", "type": "ingestion", "source": "socrata"},
     metadata={
-        "data_url": MetadataValue.url("https://data.ny.gov/Transportation/MTA-Statement-of-Operations-Beginning-2019/yg77-3tkj/about_data")
+        "data_url": MetadataValue.url("https://data.ny.gov/Transportation/MTA-Statement-of-Operations-Beginning-2019/yg77-3tkj/about_data"),
+        "storage_dtypes": storage_dtype_names(storage_dtypes(MTA_OPERATIONS_STATEMENT_COLUMNS)),
     }
 )
 def mta_operations_statement(context, socrata: SocrataResource):
-    endpoint = "https://data.ny.gov/resource/yg77-3tkj.json"
-    limit = 500000
-    offset = 0
+    params = {
+        "$order": "Month ASC, :id",
+    }
 
-    frames = []
+    # Completed pages are checkpointed, so a failed pull of the same query resumes after its last page
+    writer = ParquetPageWriter(
+        os.path.join(STAGING_PATH, "mta_operations_statement"),
+        fingerprint=_socrata_query_fingerprint(MTAOperationsStatementConstants, params),
+    )
+    if writer.resumed:
+        context.log.info(
+            f"[mta_ops_statement] Resuming from checkpoint: {len(writer.part_paths)} parts, cursor {writer.cursor}"
+        )
     last_orig_cols = []
     last_renamed_cols = []
 
-    while True:
-        params = {
-            "$limit": limit,
-            "$offset": offset,
-            "$order": "Month ASC"
-        }
-        data = socrata.fetch_data(endpoint, params)
-        if not data:
-            context.log.info(f"[mta_ops_statement] no more data at offset {offset}")
-            break
-
-        df = pl.DataFrame(data)
-        processed_df, orig_cols, renamed_cols = process_mta_operations_statement_df(df)
-        frames.append(processed_df)
+    pages = socrata.iter_pages(
+        MTAOperationsStatementConstants.ENDPOINT,
+        params,
+        page_size=MTAOperationsStatementConstants.PAGE_SIZE,
+        pagination=MTAOperationsStatementConstants.PAGINATION,
+        max_workers=MTAOperationsStatementConstants.MAX_WORKERS,
+        key=MTAOperationsStatementConstants.KEYSET_KEY,
+        response_format=MTAOperationsStatementConstants.RESPONSE_FORMAT,
+        schema=MTAOperationsStatementConstants.CSV_SCHEMA,
+        decode=False,  # Pages are decoded in the transform stage
+        start_cursor=writer.cursor,
+        with_cursor=True,
+    )
+    processed_pages = run_staged_ingestion(
+        pages,
+        socrata_page_transform(
+            process_mta_operations_statement_df,
+            response_format=MTAOperationsStatementConstants.RESPONSE_FORMAT,
+            schema=MTAOperationsStatementConstants.CSV_SCHEMA,
+        ),
+        parse_workers=MTAOperationsStatementConstants.PARSE_WORKERS,
+        max_in_flight=MTAOperationsStatementConstants.MAX_IN_FLIGHT_PAGES,
+        tagged=True,
+        fetch_buffer=_socrata_fetch_buffer(MTAOperationsStatementConstants),
+    )
+    for page_num, (result, cursor) in enumerate(processed_pages, start=1):
+        processed_df, orig_cols, renamed_cols = result
+        context.log.info(f"[mta_ops_statement] Page {page_num}: {processed_df.height} rows")
+        writer.write_page(processed_df, cursor=cursor)
 
         last_orig_cols = orig_cols
         last_renamed_cols = renamed_cols
 
-        offset += limit
-        del df, processed_df, data
-        gc.collect()
-
-    final_df = pl.concat(frames, how="vertical") if frames else pl.DataFrame([])
     return Output(
-        value=final_df,
+        value=writer,
         metadata={
-            "dagster/row_count": final_df.shape[0],
+            "dagster/row_count": writer.row_count,
             "original_columns": str(last_orig_cols),
             "renamed_columns": str(last_renamed_cols),
         },
@@ -121,22 +255,88 @@ def mta_operations_statement(context, socrata: SocrataResource):
 @asset(
     name="mta_subway_hourly_ridership",
     io_manager_key="fastopendata_partitioned_parquet_io_manager",
+    partitions_def=mta_subway_hourly_ridership_partitions,
     group_name="MTA",
     tags={"domain": "mta", "type": "ingestion", "source": "fastopendata"},
     metadata={
         "data_url": MetadataValue.url("https://data.ny.gov/Transportation/MTA-Statement-of-Operations-Beginning-2019/yg77-3tkj/about_data")
     }
 )
-def mta_subway_hourly_ridership():
+def mta_subway_hourly_ridership(context):
     """
-    Asset that wants data from March 2022 to December 2024, for example.
-    Instead of returning a Polars DataFrame, we return a dict with the
-    start/end that the IO manager can use to fetch data from R2.
+    Monthly partitioned asset. Each run materializes only the month(s) it was
+    launched for, so backfills fan out one run per month, and a failed month can
+    be retried on its own. Instead of returning a Polars DataFrame, we return a
+    dict with the start/end months that the IO manager uses to fetch data from R2.
     """
+    window = context.partition_time_window
+    # The window end is exclusive (the first day of the next month)
+    last_day = window.end - timedelta(days=1)
+    context.log.info(f"Materializing mta_subway_hourly_ridership for {context.partition_key_range}")
     return {
-        "start_year": 2022,
-        "start_month": 3,
-        "end_year": 2024,
-        "end_month": 12
+        "start_year": window.start.year,
+        "start_month": window.start.month,
+        "end_year": last_day.year,
+        "end_month": last_day.month
     }
 
+
+@asset(
+    name="mta_subway_hourly_ridership_compaction",
+    deps=["mta_subway_hourly_ridership"],
+    partitions_def=mta_subway_hourly_ridership_partitions,
+    compute_kind="Polars",
+    group_name="MTA",
+    tags={"domain": "mta", "type": "compaction", "source": "fastopendata"},
+)
+def mta_subway_hourly_ridership_compaction(context):
+    """
+    Rewrite each downloaded month of mta_subway_hourly_ridership from many small
+    batch files into one (or a few) zstd files sorted by station and time, in
+    place. DuckDB views over year=*/month=*/*.parquet then open one file per month
+    and can skip row groups on station_complex_id / transit_timestamp filters.
+    """
+    window = context.partition_time_window
+    last_day = window.end - timedelta(days=1)
+    asset_dir = os.path.join(LAKE_PATH, "mta_subway_hourly_ridership")
+    catalog = LakeCatalog(LAKE_PATH)
+
+    year, month = window.start.year, window.start.month
+    compacted = {}
+    while (year, month) <= (last_day.year, last_day.month):
+        partition_dir = os.path.join(asset_dir, f"year={year:04d}", f"month={month:02d}")
+        recover_partition(partition_dir)  # An earlier compaction may have died mid-swap
+        if os.path.isdir(partition_dir):
+            marker = compact_partition(
+                partition_dir,
+                file_prefix=f"mta_subway_hourly_ridership_{year:04d}{month:02d}",
+                sort_by=MTASubwayHourlyRidershipConstants.COMPACTION_SORT_BY,
+                target_rows_per_file=MTASubwayHourlyRidershipConstants.COMPACTION_ROWS_PER_FILE,
+                row_group_size=MTASubwayHourlyRidershipConstants.COMPACTION_ROW_GROUP_SIZE,
+            )
+            if marker is None:
+                context.log.info(f"year={year}, month={month} is already compacted.")
+            else:
+                context.log.info(
+                    f"Compacted year={year}, month={month}: {len(marker['sources'])} files -> "
+                    f"{len(marker['files'])}, {marker['bytes_before']} -> {marker['bytes']} bytes"
+                )
+                compacted[f"{year:04d}-{month:02d}"] = marker
+                catalog.sync_directory("mta_subway_hourly_ridership", partition_dir)
+        else:
+            context.log.warn(f"Nothing downloaded for year={year}, month={month}; skipping.")
+
+        month += 1
+        if month > 12:
+            month = 1
+            year += 1
+
+    return MaterializeResult(
+        metadata={
+            "compacted_months": len(compacted),
+            "dagster/row_count": sum(marker["row_count"] for marker in compacted.values()),
+            "files_after": sum(len(marker["files"]) for marker in compacted.values()),
+            "bytes_before": sum(marker["bytes_before"] for marker in compacted.values()),
+            "bytes_after": sum(marker["bytes"] for marker in compacted.values()),
+        }
+    )
@@ -1,102 +1,149 @@
 # pipeline/assets/ingestion/processing/mta_processing.py
 
+from typing import Dict, List, NamedTuple, Optional
+
 import polars as pl
 
+
+SOCRATA_TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S%.f"
+
+
+class ColumnSpec(NamedTuple):
+    """
+    How one raw Socrata column becomes one output column.
+    `source` is the (lower_snake_case) API field name. If `parse_format` is set,
+    the raw string is parsed with it, otherwise it is cast to `dtype`.
+    `storage_dtype` is the compact dtype the column is stored as, if not `dtype`.
+    """
+    source: str
+    target: str
+    dtype: pl.DataType
+    parse_format: Optional[str] = None
+    storage_dtype: Optional[pl.DataType] = None
+
+
+MTA_DAILY_COLUMNS = [
+    ColumnSpec("date", "date", pl.Date, SOCRATA_TIMESTAMP_FORMAT),
+    ColumnSpec("subways_total_estimated_ridership", "subways_total_ridership", pl.Float64, storage_dtype=pl.Int32),
+    ColumnSpec("subways_of_comparable_pre_pandemic_day", "subways_pct_pre_pandemic", pl.Float64, storage_dtype=pl.Float32),
+    ColumnSpec("buses_total_estimated_ridersip", "buses_total_ridership", pl.Float64, storage_dtype=pl.Int32),
+    ColumnSpec("buses_of_comparable_pre_pandemic_day", "buses_pct_pre_pandemic", pl.Float64, storage_dtype=pl.Float32),
+    ColumnSpec("lirr_total_estimated_ridership", "lirr_total_ridership", pl.Float64, storage_dtype=pl.Int32),
+    ColumnSpec("lirr_of_comparable_pre_pandemic_day", "lirr_pct_pre_pandemic", pl.Float64, storage_dtype=pl.Float32),
+    ColumnSpec("metro_north_total_estimated_ridership", "metro_north_total_ridership", pl.Float64, storage_dtype=pl.Int32),
+    ColumnSpec("metro_north_of_comparable_pre_pandemic_day", "metro_north_pct_pre_pandemic", pl.Float64, storage_dtype=pl.Float32),
+    ColumnSpec("access_a_ride_total_scheduled_trips", "access_a_ride_total_trips", pl.Float64, storage_dtype=pl.Int32),
+    ColumnSpec("access_a_ride_of_comparable_pre_pandemic_day", "access_a_ride_pct_pre_pandemic", pl.Float64, storage_dtype=pl.Float32),
+    ColumnSpec("bridges_and_tunnels_total_traffic", "bridges_tunnels_total_traffic", pl.Float64, storage_dtype=pl.Int32),
+    ColumnSpec("bridges_and_tunnels_of_comparable_pre_pandemic_day", "bridges_tunnels_pct_pre_pandemic", pl.Float64, storage_dtype=pl.Float32),
+    ColumnSpec("staten_island_railway_total_estimated_ridership", "staten_island_railway_total_ridership", pl.Float64, storage_dtype=pl.Int32),
+    ColumnSpec("staten_island_railway_of_comparable_pre_pandemic_day", "staten_island_railway_pct_pre_pandemic", pl.Float64, storage_dtype=pl.Float32),
+]
+
+MTA_OPERATIONS_STATEMENT_COLUMNS = [
+    ColumnSpec("month", "timestamp", pl.Date, SOCRATA_TIMESTAMP_FORMAT),
+    ColumnSpec("fiscal_year", "fiscal_year", pl.Int64, storage_dtype=pl.Int16),
+    ColumnSpec("financial_plan_year", "financial_plan_year", pl.Int64, storage_dtype=pl.Int16),
+    ColumnSpec("amount", "amount", pl.Float64),
+    ColumnSpec("scenario", "scenario", pl.Utf8, storage_dtype=pl.Categorical),
+    ColumnSpec("expense_type", "expense_type", pl.Utf8, storage_dtype=pl.Categorical),
+    ColumnSpec("agency", "agency", pl.Utf8, storage_dtype=pl.Categorical),
+    ColumnSpec("type", "type", pl.Utf8, storage_dtype=pl.Categorical),
+    ColumnSpec("subtype", "subtype", pl.Utf8, storage_dtype=pl.Categorical),
+    ColumnSpec("general_ledger", "general_ledger", pl.Utf8, storage_dtype=pl.Categorical),
+]
+
+UNKNOWN_AGENCY = "Unknown Agency"
+
+MTA_AGENCY_FULL_NAMES = {
+    "LIRR": "Long Island Rail Road",
+    "BT": "Bridges and Tunnels",
+    "FMTAC": "First Mutual Transportation Assurance Company",
+    "NYCT": "New York City Transit",
+    "SIR": "Staten Island Railway",
+    "MTABC": "MTA Bus Company",
+    "GCMCOC": "Grand Central Madison Concourse Operating Company",
+    "MNR": "Metro-North Railroad",
+    "MTAHQ": "Metropolitan Transportation Authority Headquarters",
+    "CD": "MTA Construction and Development",
+    "CRR": "Connecticut Railroads",
+}
+
+AGENCY_FULL_NAME_ENUM = pl.Enum(list(MTA_AGENCY_FULL_NAMES.values()) + [UNKNOWN_AGENCY])
+
+
+def csv_schema(columns: List[ColumnSpec]) -> Dict[str, pl.DataType]:
+    """
+    Explicit dtypes for the raw Socrata CSV columns, keyed by API field name.
+    Columns that need a parse format (the timestamps) are left to be read as
+    strings and parsed by the processing plan.
+    """
+    return {spec.source: spec.dtype for spec in columns if spec.parse_format is None}
+
+
+def storage_dtypes(columns: List[ColumnSpec]) -> Dict[str, pl.DataType]:
+    """
+    The compact storage dtype of each output column that declares one, keyed by target name.
+    """
+    return {spec.target: spec.storage_dtype for spec in columns if spec.storage_dtype is not None}
+
+
+MTA_DAILY_CSV_SCHEMA = csv_schema(MTA_DAILY_COLUMNS)
+MTA_OPERATIONS_STATEMENT_CSV_SCHEMA = csv_schema(MTA_OPERATIONS_STATEMENT_COLUMNS)
+
+
+def apply_column_specs(lf: pl.LazyFrame, columns: List[ColumnSpec]) -> pl.LazyFrame:
+    """
+    Add one select to the plan that renames, parses and casts every column named
+    in `columns`. Other columns pass through untouched, and specs whose source
+    column is missing from this page are skipped.
+    """
+    specs = {spec.source: spec for spec in columns}
+    exprs = []
+    for name in lf.collect_schema().names():
+        spec = specs.get(name)
+        if spec is None:
+            exprs.append(pl.col(name))
+        elif spec.parse_format is not None:
+            exprs.append(
+                pl.col(name).str.strptime(spec.dtype, format=spec.parse_format, strict=False).alias(spec.target)
+            )
+        else:
+            exprs.append(pl.col(name).cast(spec.dtype).alias(spec.target))
+    return lf.select(exprs)
+
+
 def process_mta_daily_df(df: pl.DataFrame) -> (pl.DataFrame, list, list, str):
     orig_cols = df.columns
-    df = df.rename({col: col.lower().replace(" ", "_") for col in df.columns})
-    renamed_cols = df.columns
+    lf = df.lazy().rename({col: col.lower().replace(" ", "_") for col in df.columns})
+    renamed_cols = lf.collect_schema().names()
+
+    df = apply_column_specs(lf, MTA_DAILY_COLUMNS).collect()
 
-    # parse 'date' column
     date_sample = "N/A"
     if "date" in df.columns:
-        df = df.with_columns(
-            pl.col("date").str.strptime(pl.Date, format="%Y-%m-%dT%H:%M:%S%.f", strict=False).alias("date")
-        )
-        date_sample_df = df.select("date").head(3).to_dicts()
-        date_sample = str(date_sample_df)
-
-    # cast columns
-    old_new_cols = [
-        ("subways_total_estimated_ridership", "subways_total_ridership"),
-        ("subways_of_comparable_pre_pandemic_day", "subways_pct_pre_pandemic"),
-        ("buses_total_estimated_ridersip", "buses_total_ridership"),
-        ("buses_of_comparable_pre_pandemic_day", "buses_pct_pre_pandemic"),
-        ("lirr_total_estimated_ridership", "lirr_total_ridership"),
-        ("lirr_of_comparable_pre_pandemic_day", "lirr_pct_pre_pandemic"),
-        ("metro_north_total_estimated_ridership", "metro_north_total_ridership"),
-        ("metro_north_of_comparable_pre_pandemic_day", "metro_north_pct_pre_pandemic"),
-        ("access_a_ride_total_scheduled_trips", "access_a_ride_total_trips"),
-        ("access_a_ride_of_comparable_pre_pandemic_day", "access_a_ride_pct_pre_pandemic"),
-        ("bridges_and_tunnels_total_traffic", "bridges_tunnels_total_traffic"),
-        ("bridges_and_tunnels_of_comparable_pre_pandemic_day", "bridges_tunnels_pct_pre_pandemic"),
-        ("staten_island_railway_total_estimated_ridership", "staten_island_railway_total_ridership"),
-        ("staten_island_railway_of_comparable_pre_pandemic_day", "staten_island_railway_pct_pre_pandemic"),
-    ]
-
-    exprs = []
-    drop_these = []
-    for old_col, new_col in old_new_cols:
-        if old_col in df.columns:
-            exprs.append(pl.col(old_col).cast(pl.Float64).alias(new_col))
-            drop_these.append(old_col)
-
-    if exprs:
-        df = df.with_columns(exprs).drop(drop_these)
+        date_sample = str(df.get_column("date").head(3).to_list())
 
     return df, orig_cols, renamed_cols, date_sample
 
 
 def process_mta_operations_statement_df(df: pl.DataFrame) -> (pl.DataFrame, list, list):
     orig_cols = df.columns
-    df = df.rename(
+    lf = df.lazy().rename(
         {col: col.lower().replace(" ", "_").replace("-", "_") for col in df.columns}
-    ).rename({"month": "timestamp"})
-    renamed_cols = df.columns
-
-    if "timestamp" in df.columns:
-        df = df.with_columns([
-            pl.col("timestamp").str.strptime(pl.Date, format="%Y-%m-%dT%H:%M:%S%.f", strict=False).alias("timestamp")
-        ])
-
-    query = """
-    SELECT *,
-        CASE 
-            WHEN agency = 'LIRR' THEN 'Long Island Rail Road'
-            WHEN agency = 'BT' THEN 'Bridges and Tunnels'
-            WHEN agency = 'FMTAC' THEN 'First Mutual Transportation Assurance Company'
-            WHEN agency = 'NYCT' THEN 'New York City Transit'
-            WHEN agency = 'SIR' THEN 'Staten Island Railway'
-            WHEN agency = 'MTABC' THEN 'MTA Bus Company'
-            WHEN agency = 'GCMCOC' THEN 'Grand Central Madison Concourse Operating Company'
-            WHEN agency = 'MNR' THEN 'Metro-North Railroad'
-            WHEN agency = 'MTAHQ' THEN 'Metropolitan Transportation Authority Headquarters'
-            WHEN agency = 'CD' THEN 'MTA Construction and Development'
-            WHEN agency = 'CRR' THEN 'Connecticut Railroads'
-            ELSE 'Unknown Agency'
-        END AS agency_full_name
-    FROM self
-    """
-    df = df.sql(query)
-
-    casts = [
-        ("fiscal_year", pl.Int64),
-        ("financial_plan_year", pl.Int64),
-        ("amount", pl.Float64),
-        ("scenario", pl.Utf8),
-        ("expense_type", pl.Utf8),
-        ("agency", pl.Utf8),
-        ("agency_full_name", pl.Utf8),
-        ("type", pl.Utf8),
-        ("subtype", pl.Utf8),
-        ("general_ledger", pl.Utf8),
+    )
+    renamed_cols = [
+        "timestamp" if name == "month" else name for name in lf.collect_schema().names()
     ]
-    exprs = []
-    for col_name, dtype in casts:
-        if col_name in df.columns:
-            exprs.append(pl.col(col_name).cast(dtype))
 
-    if exprs:
-        df = df.with_columns(exprs)
+    lf = apply_column_specs(lf, MTA_OPERATIONS_STATEMENT_COLUMNS)
+
+    if "agency" in renamed_cols:
+        lf = lf.with_columns(
+            pl.col("agency")
+            .replace_strict(MTA_AGENCY_FULL_NAMES, default=UNKNOWN_AGENCY, return_dtype=AGENCY_FULL_NAME_ENUM)
+            .fill_null(UNKNOWN_AGENCY)
+            .alias("agency_full_name")
+        )
 
-    return df, orig_cols, renamed_cols
\ No newline at end of file
+    return lf.collect(), orig_cols, renamed_cols
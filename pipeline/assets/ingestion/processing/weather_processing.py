@@ -0,0 +1,74 @@
+# pipeline/assets/ingestion/processing/weather_processing.py
+
+from datetime import datetime
+from typing import Optional
+
+import polars as pl
+
+from pipeline.utils.open_mateo_free_api import DAILY_VARS, HOURLY_VARS
+
+
+# Daily fields the hourly series can't provide; these still come from the daily API
+DAILY_ONLY_VARS = {
+    "sunrise": "sunrise",
+    "sunset": "sunset",
+}
+
+# Column order of daily_weather_asset, whether fetched or derived
+DAILY_COLUMNS = ["date", *DAILY_VARS.values()]
+
+# Compact storage dtypes. Weather codes are small integers; the measurements don't
+# need more than Float32. `location` and sunrise/sunset stay plain strings.
+HOURLY_STORAGE_DTYPES = {
+    column: pl.Int16 if column == "weather_code" else pl.Float32 for column in HOURLY_VARS.values()
+}
+DAILY_STORAGE_DTYPES = {
+    column: pl.Int16 if column == "weather_code" else pl.Float32
+    for column in DAILY_VARS.values()
+    if column not in DAILY_ONLY_VARS.values()
+}
+
+
+def derive_daily_from_hourly(hourly: pl.LazyFrame, sun: pl.LazyFrame, start_date: Optional[str] = None) -> pl.LazyFrame:
+    """
+    Aggregate the hourly weather series into daily_weather_asset's columns, the
+    same way Open-Meteo's daily endpoint does: hourly timestamps are already in
+    local time, so each calendar day is one group_by_dynamic window.
+
+      - weather_code: the most severe (highest) hourly code of the day
+      - temperature_* / apparent_temperature_*: max, min and mean of the hours
+      - precipitation_sum, rain_sum, snowfall_sum: sums of the hourly amounts
+      - precipitation_hours: hours with any precipitation
+
+    `sun` supplies sunrise/sunset per date, and is left-joined on. Multi-location
+    series are grouped and joined per `location`. Days before `start_date` (the
+    hourly series may start earlier) are dropped.
+    """
+    by_location = "location" in hourly.collect_schema().names()
+    keys = ["location"] if by_location else []
+    if by_location:
+        # Stored files may hold `location` as Categorical (dtype compaction); join on plain strings
+        hourly = hourly.with_columns(pl.col("location").cast(pl.Utf8))
+        sun = sun.with_columns(pl.col("location").cast(pl.Utf8))
+    if start_date is not None:
+        hourly = hourly.filter(pl.col("date") >= datetime.fromisoformat(start_date))
+
+    daily = (
+        hourly.sort([*keys, "date"])
+        .group_by_dynamic("date", every="1d", group_by=keys or None)
+        .agg(
+            pl.col("weather_code").max().alias("weather_code"),
+            pl.col("temperature_2m").max().alias("temperature_max"),
+            pl.col("temperature_2m").min().alias("temperature_min"),
+            pl.col("temperature_2m").mean().alias("temperature_mean"),
+            pl.col("apparent_temperature").max().alias("apparent_temperature_max"),
+            pl.col("apparent_temperature").min().alias("apparent_temperature_min"),
+            pl.col("apparent_temperature").mean().alias("apparent_temperature_mean"),
+            pl.col("precipitation").sum().alias("precipitation_sum"),
+            pl.col("rain").sum().alias("rain_sum"),
+            pl.col("snowfall").sum().alias("snowfall_sum"),
+            (pl.col("precipitation") > 0).sum().cast(pl.Float64).alias("precipitation_hours"),
+        )
+    )
+
+    return daily.join(sun, on=[*keys, "date"], how="left").select([*keys, *DAILY_COLUMNS])
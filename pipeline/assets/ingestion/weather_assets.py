@@ -1,28 +1,96 @@
+import os
+from datetime import date, datetime, timedelta
+from typing import Tuple
+
+import polars as pl
 from dagster import asset, Output
 
+from pipeline.constants import HTTP_CACHE_PATH, LAKE_PATH
+from pipeline.resources.io_managers.single_file_polars_parquet_io_manager import single_file_parquet_path
+from pipeline.utils.http_cache import HttpResponseCache
+from pipeline.utils.incremental import append_merge, read_high_water_mark
+from pipeline.utils.dtype_optimization import storage_dtype_names
+from .processing.weather_processing import (
+    DAILY_ONLY_VARS,
+    DAILY_STORAGE_DTYPES,
+    HOURLY_STORAGE_DTYPES,
+    derive_daily_from_hourly,
+)
 from pipeline.utils.open_mateo_free_api import (
+    HOURLY_VARS,
     OpenMateoDailyWeatherConfig,
     OpenMateoHourlyWeatherConfig,
     OpenMateoDailyWeatherClient,
     OpenMateoHourlyWeatherClient,
 )
 
+# (location_id, latitude, longitude) for each borough, for station-level joins.
+# Set a constants class's LOCATIONS to this to fetch one series per borough.
+NYC_BOROUGH_CENTROIDS = [
+    ("manhattan", 40.7831, -73.9712),
+    ("brooklyn", 40.6782, -73.9442),
+    ("queens", 40.7282, -73.7949),
+    ("bronx", 40.8448, -73.8648),
+    ("staten_island", 40.5795, -74.1502),
+]
+
+
 class OpenMateoDailyWeatherConstants:
     START_DATE = "2021-02-24"
-    END_DATE = "2025-03-15"
+    DERIVE_FROM_HOURLY = True  # Aggregate hourly_weather_asset locally; only sunrise/sunset are fetched
+    ARCHIVE_LAG_DAYS = 5  # The archive API trails real time by a few days; fetch up to today minus this
+    INCREMENTAL = True    # Only fetch dates past the max date already stored
+    OVERLAP_DAYS = 3      # Re-fetch the newest stored days, which the archive may still revise
     LATITUDE = 40.7143
     LONGITUDE = -74.006
+    LOCATIONS = None  # Or a list like NYC_BOROUGH_CENTROIDS; output then gets a `location` column
     TIMEZONE = "America/New_York"
     TEMPERATURE_UNIT = "fahrenheit"
+    MAX_WORKERS = 4                # Date chunks fetched in parallel
+    MAX_REQUESTS_PER_SECOND = 5.0  # Stays well under Open-Meteo's free-tier limit of 600 calls/minute
 
 
 class OpenMateoHourlyWeatherConstants:
     START_DATE = "2021-02-01"
-    END_DATE = "2025-03-15"
+    ARCHIVE_LAG_DAYS = 5  # The archive API trails real time by a few days; fetch up to today minus this
+    INCREMENTAL = True    # Only fetch dates past the max date already stored
+    OVERLAP_DAYS = 3      # Re-fetch the newest stored days, which the archive may still revise
     LATITUDE = 40.7143
     LONGITUDE = -74.006
+    LOCATIONS = None  # Or a list like NYC_BOROUGH_CENTROIDS; output then gets a `location` column
     TIMEZONE = "America/New_York"
     TEMPERATURE_UNIT = "fahrenheit"
+    MAX_WORKERS = 4                # Date chunks fetched in parallel
+    MAX_REQUESTS_PER_SECOND = 5.0  # Stays well under Open-Meteo's free-tier limit of 600 calls/minute
+
+
+def _incremental_date_range(constants, file_path: str, context, required_columns=None) -> Tuple[str, str]:
+    """
+    Work out which dates to fetch: from the stored high-water mark (minus the
+    overlap window), or START_DATE on a first run, up to today minus the
+    archive lag. Returns ISO date strings; start > end means nothing is new yet.
+
+    If the stored file lacks any of `required_columns` (e.g. a variable was
+    added), the whole range is fetched again.
+    """
+    start_date = constants.START_DATE
+    end_date = (date.today() - timedelta(days=constants.ARCHIVE_LAG_DAYS)).isoformat()
+
+    incremental = constants.INCREMENTAL
+    if incremental and required_columns and os.path.exists(file_path):
+        missing = [name for name in required_columns if name not in pl.read_parquet_schema(file_path)]
+        if missing:
+            context.log.info(f"Stored file lacks columns {missing}; fetching the full range again.")
+            incremental = False
+
+    high_water_mark = read_high_water_mark(file_path, "date") if incremental else None
+    if high_water_mark is not None:
+        if isinstance(high_water_mark, datetime):
+            high_water_mark = high_water_mark.date()
+        refetch_from = (high_water_mark - timedelta(days=constants.OVERLAP_DAYS)).isoformat()
+        start_date = max(start_date, refetch_from)
+        context.log.info(f"Stored data runs to {high_water_mark}; fetching {start_date} to {end_date}.")
+    return start_date, end_date
 
 
 @asset(
@@ -31,11 +99,22 @@ class OpenMateoHourlyWeatherConstants:
     io_manager_key="single_file_polars_parquet_io_manager",
     group_name="weather",
     tags={"domain": "weather", "type": "ingestion", "source": "open-meteo"},
+    deps=["hourly_weather_asset"],  # Only read when DERIVE_FROM_HOURLY is set
+    metadata={"storage_dtypes": storage_dtype_names(DAILY_STORAGE_DTYPES)},
 )
 def daily_weather_asset(context):
+    """
+    Daily NYC weather. With DERIVE_FROM_HOURLY, most columns are aggregated
+    from hourly_weather_asset, and only sunrise/sunset are fetched (incrementally),
+    which halves the archive API traffic. Otherwise every daily variable is fetched.
+    """
+    file_path = single_file_parquet_path(LAKE_PATH, "daily_weather_asset")
+    derive = OpenMateoDailyWeatherConstants.DERIVE_FROM_HOURLY
+    start_date, end_date = _incremental_date_range(OpenMateoDailyWeatherConstants, file_path, context)
+
     config = OpenMateoDailyWeatherConfig(
-        start_date=OpenMateoDailyWeatherConstants.START_DATE,
-        end_date=OpenMateoDailyWeatherConstants.END_DATE,
+        start_date=start_date,
+        end_date=end_date,
         latitude=OpenMateoDailyWeatherConstants.LATITUDE,
         longitude=OpenMateoDailyWeatherConstants.LONGITUDE,
         timezone=OpenMateoDailyWeatherConstants.TIMEZONE,
@@ -50,22 +129,48 @@ def daily_weather_asset(context):
         connect_timeout=10.0,
         read_timeout=30.0,
         logger=context.log,  # Use Dagster's log for integrated logging
+        cache=HttpResponseCache(HTTP_CACHE_PATH, logger=context.log),  # Same cache directory as the Socrata resource
+        max_workers=OpenMateoDailyWeatherConstants.MAX_WORKERS,
+        max_requests_per_second=OpenMateoDailyWeatherConstants.MAX_REQUESTS_PER_SECOND,
+        locations=OpenMateoDailyWeatherConstants.LOCATIONS,
+        daily_vars=DAILY_ONLY_VARS if derive else None,
     )
 
-    # You can pass chunked=True if needed
-    daily_df = client.fetch_daily_data(chunked=False)
+    # Chunks are sized to the variable count and fetched in parallel; pass chunked=False for one request
+    new_df = client.fetch_daily_data() if start_date <= end_date else pl.DataFrame()
+
+    if derive:
+        hourly_path = single_file_parquet_path(LAKE_PATH, "hourly_weather_asset")
+        if not os.path.exists(hourly_path):
+            raise FileNotFoundError(
+                f"daily_weather_asset derives from hourly_weather_asset, but {hourly_path} doesn't exist yet. "
+                "Materialize hourly_weather_asset first."
+            )
+        keys = ["location"] if OpenMateoDailyWeatherConstants.LOCATIONS else []
+        sun_columns = [*keys, "date", *DAILY_ONLY_VARS.values()]
+        sun = append_merge(file_path, new_df, "date", columns=sun_columns)
+        if sun.is_empty():
+            sun = pl.DataFrame(schema={**{key: pl.Utf8 for key in keys}, "date": pl.Datetime("us"), "sunrise": pl.Utf8, "sunset": pl.Utf8})
+        daily_df = derive_daily_from_hourly(
+            pl.scan_parquet(hourly_path), sun.lazy(), start_date=OpenMateoDailyWeatherConstants.START_DATE
+        ).collect()
+    else:
+        daily_df = append_merge(file_path, new_df, "date")
 
     if daily_df.is_empty():
-        context.log.warning("No daily weather data returned for the specified range.")
-    else:
-        head_sample = daily_df.head(5).to_dicts()
-        context.log.info(f"Daily DataFrame has {daily_df.shape[0]} rows total.")
+        # Nothing stored and nothing new: don't write a column-less file for readers to trip on
+        context.log.warning("No daily weather data stored or returned for the specified range; nothing written.")
+        return Output(value=None, metadata={"dagster/row_count": 0, "fetched_range": f"{start_date} to {end_date}"})
+    head_sample = daily_df.head(5).to_dicts()
+    context.log.info(f"Daily DataFrame has {daily_df.shape[0]} rows total.")
 
     return Output(
         value=daily_df,
         metadata={
             "dagster/row_count": daily_df.shape[0],
-            "sample_rows": str(daily_df.head(5).to_dicts()) if not daily_df.is_empty() else "[]",
+            "fetched_rows": new_df.shape[0],
+            "fetched_range": f"{start_date} to {end_date}",
+            "sample_rows": str(head_sample),
         },
     )
 
@@ -76,11 +181,18 @@ def daily_weather_asset(context):
     io_manager_key="single_file_polars_parquet_io_manager",
     group_name="weather",
     tags={"domain": "weather", "type": "ingestion", "source": "open-meteo"},
+    metadata={"storage_dtypes": storage_dtype_names(HOURLY_STORAGE_DTYPES)},
 )
 def hourly_weather_asset(context):
+    file_path = single_file_parquet_path(LAKE_PATH, "hourly_weather_asset")
+    # A variable added to HOURLY_VARS since the last run triggers a full refetch
+    start_date, end_date = _incremental_date_range(
+        OpenMateoHourlyWeatherConstants, file_path, context, required_columns=list(HOURLY_VARS.values())
+    )
+
     config = OpenMateoHourlyWeatherConfig(
-        start_date=OpenMateoHourlyWeatherConstants.START_DATE,
-        end_date=OpenMateoHourlyWeatherConstants.END_DATE,
+        start_date=start_date,
+        end_date=end_date,
         latitude=OpenMateoHourlyWeatherConstants.LATITUDE,
         longitude=OpenMateoHourlyWeatherConstants.LONGITUDE,
         timezone=OpenMateoHourlyWeatherConstants.TIMEZONE,
@@ -94,20 +206,28 @@ def hourly_weather_asset(context):
         connect_timeout=10.0,
         read_timeout=30.0,
         logger=context.log,
+        cache=HttpResponseCache(HTTP_CACHE_PATH, logger=context.log),
+        max_workers=OpenMateoHourlyWeatherConstants.MAX_WORKERS,
+        max_requests_per_second=OpenMateoHourlyWeatherConstants.MAX_REQUESTS_PER_SECOND,
+        locations=OpenMateoHourlyWeatherConstants.LOCATIONS,
     )
 
-    hourly_df = client.fetch_hourly_data(chunked=False)  # Example: chunked fetch for hourly data
+    new_df = client.fetch_hourly_data() if start_date <= end_date else pl.DataFrame()  # Parallel chunked fetch
+    hourly_df = append_merge(file_path, new_df, "date")
 
     if hourly_df.is_empty():
-        context.log.warning("No hourly weather data returned for the specified range.")
-    else:
-        head_sample = hourly_df.head(5).to_dicts()
-        context.log.info(f"Hourly DataFrame has {hourly_df.shape[0]} rows total.")
+        # Nothing stored and nothing new: don't write a column-less file for readers to trip on
+        context.log.warning("No hourly weather data stored or returned for the specified range; nothing written.")
+        return Output(value=None, metadata={"dagster/row_count": 0, "fetched_range": f"{start_date} to {end_date}"})
+    head_sample = hourly_df.head(5).to_dicts()
+    context.log.info(f"Hourly DataFrame has {hourly_df.shape[0]} rows total.")
 
     return Output(
         value=hourly_df,
         metadata={
             "dagster/row_count": hourly_df.shape[0],
-            "sample_rows": str(hourly_df.head(5).to_dicts()) if not hourly_df.is_empty() else "[]",
+            "fetched_rows": new_df.shape[0],
+            "fetched_range": f"{start_date} to {end_date}",
+            "sample_rows": str(head_sample),
         },
     )
@@ -1,19 +1,22 @@
-
 import os
 from dagster import asset, AssetExecutionContext
-from pipeline.constants import WAREHOUSE_PATH
-from pathlib import Path
 
 from pipeline.constants import (
     SINGLE_PATH_ASSETS_PATHS,
     PARTITIONED_ASSETS_PATHS,
     WAREHOUSE_PATH,
+    LAKE_PATH,
+    LAKE_CATALOG_PATH,
+    DBT_MODELS_PATH,
+    WAREHOUSE_MATERIALIZATIONS,
 )
-from pipeline.utils.duckdb_wrapper import DuckDBWrapper
+from pipeline.utils.lake_catalog import LakeCatalog
+from pipeline.utils.warehouse_builder import reconcile_warehouse, warehouse_sources
 
 @asset(
     deps=[
         "mta_subway_hourly_ridership",
+        "mta_subway_hourly_ridership_compaction",
         "mta_daily_ridership",
         "mta_operations_statement",
         "daily_weather_asset",
@@ -24,55 +27,37 @@ from pipeline.utils.duckdb_wrapper import DuckDBWrapper
 )
 def duckdb_warehouse(context: AssetExecutionContext):
     """
-    Creates a persistent DuckDB file at WAREHOUSE_PATH and registers each
-    asset as a DuckDB view. Partitioned assets use a different method.
-    Creates the directory and database if they don't exist, and replaces
-    any existing DuckDB file with a new one.
+    Keeps a persistent DuckDB file at WAREHOUSE_PATH in sync with the lake,
+    with each asset registered as a DuckDB view or a native table, per
+    WAREHOUSE_MATERIALIZATIONS or an automatic choice by size and query
+    frequency. Partitioned assets use a different method.
+
+    The file is never deleted: only assets whose files (names, sizes, mtimes,
+    schemas) changed since the last run are re-registered, and other objects in
+    the warehouse, such as dbt models, are left untouched. Partitioned native
+    tables only reload the months that changed.
     """
-
-    # Ensure WAREHOUSE_PATH directory exists
-    warehouse_dir = Path(WAREHOUSE_PATH).parent
-    warehouse_dir.mkdir(parents=True, exist_ok=True)
-
-    # If a DuckDB file exists at WAREHOUSE_PATH, delete it
-    if os.path.exists(WAREHOUSE_PATH):
-        os.remove(WAREHOUSE_PATH)
-        context.log.info(f"Existing DuckDB file at {WAREHOUSE_PATH} deleted.")
-
-    # Create new DuckDB connection (this will create a new file)
-    duckdb_wrapper = DuckDBWrapper(WAREHOUSE_PATH)
-    context.log.info(f"New DuckDB file created at {WAREHOUSE_PATH}")
-
-    # Register non-partitioned assets (MTA, OTHER_MTA, WEATHER)
-    non_partitioned = {**SINGLE_PATH_ASSETS_PATHS}
-    if non_partitioned:
-        table_names = list(non_partitioned.keys())
-        repo_root = os.path.dirname(WAREHOUSE_PATH)  # Use the warehouse's parent dir as repo_root
-        base_path = os.path.relpath(os.path.dirname(list(non_partitioned.values())[0]), repo_root)
-        duckdb_wrapper.bulk_register_data(
-            repo_root=repo_root,
-            base_path=base_path,
-            table_names=table_names,
-            wildcard="*.parquet",
-            as_table=False,  # Register as views
-            show_tables=False
-        )
-
-    # Register partitioned assets
-    partitioned = {**PARTITIONED_ASSETS_PATHS}
-    if partitioned:
-        table_names = list(partitioned.keys())
-        repo_root = os.path.dirname(WAREHOUSE_PATH)  # Use the warehouse's parent dir as repo_root
-        base_path = os.path.relpath(os.path.dirname(list(partitioned.values())[0]), repo_root)
-        duckdb_wrapper.bulk_register_partitioned_data(
-            repo_root=repo_root,
-            base_path=base_path,
-            table_names=table_names,
-            wildcard="year=*/month=*/*.parquet",
-            as_table=False,  # Register as views
-            show_tables=False  # Optional: show tables for verification
-        )
-
-    duckdb_wrapper.con.close()
-    context.log.info("Connection to DuckDB closed.")
-    return None
\ No newline at end of file
+    sources = warehouse_sources(
+        SINGLE_PATH_ASSETS_PATHS,
+        PARTITIONED_ASSETS_PATHS,
+        repo_root=os.path.dirname(WAREHOUSE_PATH),  # Use the warehouse's parent dir as repo_root
+        materializations=WAREHOUSE_MATERIALIZATIONS,
+    )
+    summary = reconcile_warehouse(
+        WAREHOUSE_PATH,
+        sources,
+        catalog=LakeCatalog(LAKE_PATH, LAKE_CATALOG_PATH),
+        sql_dirs=[DBT_MODELS_PATH, os.path.dirname(WAREHOUSE_PATH)],  # dbt models and Evidence source queries
+        log=context.log.info,
+    )
+
+    context.add_output_metadata(
+        {
+            "rebuilt": summary["rebuilt"],
+            "unchanged": summary["unchanged"],
+            "skipped": summary["skipped"],
+            "materializations": summary["materializations"],
+            "refreshed_partitions": summary["refreshed_partitions"],
+        }
+    )
+    return None
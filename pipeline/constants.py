@@ -10,10 +10,22 @@ from pipeline.datasets import *
 # Define the base path relative to the location where we will keep our data lake of parquet files.
 LAKE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "opendata"))
 
+# Scratch space under the lake where paged assets spill their part files before the IO manager finalizes them
+STAGING_PATH = os.path.join(LAKE_PATH, "_staging")
+
+# SQLite catalog of every parquet file in the lake (see pipeline/utils/lake_catalog.py)
+LAKE_CATALOG_PATH = os.path.join(LAKE_PATH, "_catalog.db")
+
+# On-disk HTTP response cache shared by the Socrata resource and the Open-Meteo clients
+HTTP_CACHE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "http_cache"))
+
 # Base path to store our DuckDB. We store this DuckDB file in its own spot in data
 WAREHOUSE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "app", "sources", "app", "data.duckdb"))
 
 
+# dbt models; how many of them read a lake asset feeds the warehouse's materialization policy
+DBT_MODELS_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "transformations", "dbt", "models"))
+
 # Path to where we will store our Dagster logs
 DAGSTER_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "logs"))
 
@@ -33,4 +45,14 @@ SINGLE_PATH_ASSETS_PATHS = {
 PARTITIONED_ASSETS_PATHS = {
     asset_name: f"{LAKE_PATH}/{asset_name}"
     for asset_name in PARTITIONED_ASSETS_NAMES
-}
\ No newline at end of file
+}
+
+# Pinned warehouse materializations (see pipeline/utils/warehouse_builder.py). Assets not listed
+# here are a view or a native table depending on their size and how many queries read them.
+WAREHOUSE_MATERIALIZATIONS = {
+    # The largest and most queried source: store it natively, sorted on time so date filters skip row groups
+    "mta_subway_hourly_ridership": {
+        "materialization": "sorted_table",
+        "sort_by": ["transit_timestamp", "station_complex_id"],
+    },
+}
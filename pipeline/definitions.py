@@ -1,7 +1,8 @@
 import dagster
 import os
-from dagster import Definitions, load_assets_from_modules
+from dagster import Definitions, load_assets_from_modules, define_asset_job, build_schedule_from_partitioned_job
 from pipeline.assets.ingestion import mta_assets, weather_assets #Our ingestion assets
+from pipeline.assets.ingestion.mta_assets import MTASubwayHourlyRidershipConstants, mta_subway_hourly_ridership_partitions
 from pipeline.assets.warehouse import duckdb_warehouse #Our code for making a DuckDB warehouse from parquet files
 
 # Our DBT imports
@@ -10,6 +11,7 @@ from pipeline.assets.dbt_assets import dbt_project_assets  # Our DBT assets
 from pipeline.assets.dbt_assets import dbt_project #Tells Dagster where it can find our DBT code relative to this file
 
 from pipeline.constants import LAKE_PATH  #The base path for our data lake of parquet files
+from pipeline.constants import HTTP_CACHE_PATH  #Where API responses are cached between runs
 
 from pipeline.resources.io_managers.single_file_polars_parquet_io_manager import SingleFilePolarsParquetIOManager #Our IO Manager for storing dagster dataframes as parquet files
 from pipeline.resources.io_managers.fastopendata_partitioned_parquet_io_manager import FastOpenDataPartitionedParquetIOManager
@@ -26,10 +28,24 @@ weather_assets = load_assets_from_modules([weather_assets])
 duckdb_warehouse = load_assets_from_modules([duckdb_warehouse])
 
 
+# Monthly job for the partitioned hourly ridership and its compaction. The schedule materializes only the month that just ended.
+mta_subway_hourly_ridership_job = define_asset_job(
+    name="mta_subway_hourly_ridership_job",
+    selection=["mta_subway_hourly_ridership", "mta_subway_hourly_ridership_compaction"],
+    partitions_def=mta_subway_hourly_ridership_partitions,
+)
+
+mta_subway_hourly_ridership_schedule = build_schedule_from_partitioned_job(
+    mta_subway_hourly_ridership_job,
+    day_of_month=MTASubwayHourlyRidershipConstants.SCHEDULE_DAY_OF_MONTH,
+    hour_of_day=MTASubwayHourlyRidershipConstants.SCHEDULE_HOUR_OF_DAY,
+)
+
+
 #First, define our resources and io_managers
 
 # Create the Socrata resource
-socrata = SocrataResource()  # Using default env var for the token
+socrata = SocrataResource(cache_dir=HTTP_CACHE_PATH)  # Using default env var for the token
 
 dbt=DbtCliResource(project_dir=dbt_project.project_dir)
 
@@ -57,5 +73,7 @@ resources = {
 # Define the Dagster assets taking part in our data platform, and the resources they can use
 defs = Definitions(
     assets=mta_assets + weather_assets + duckdb_warehouse + [dbt_project_assets],  # Include all MTA and DBT assets
-    resources=resources
+    resources=resources,
+    jobs=[mta_subway_hourly_ridership_job],
+    schedules=[mta_subway_hourly_ridership_schedule],
 )
\ No newline at end of file
@@ -1,23 +1,54 @@
+import glob
+import json
 import os
+import threading
+import time
+from typing import Optional
+
 import requests
+from requests.adapters import HTTPAdapter
 import polars as pl
 from dagster import ConfigurableIOManager, OutputContext, InputContext
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 # Tenacity imports for retry logic
 from tenacity import retry, wait_fixed, stop_after_attempt, retry_if_exception_type
 
+from pipeline.utils.adaptive_concurrency import AdaptiveConcurrencyController
+from pipeline.utils.lake_catalog import LakeCatalog
+from pipeline.utils.parquet_compaction import drop_compaction, read_compaction_marker, recover_partition
+
+# Outcomes of _download_file. A 404 returns None instead.
+DOWNLOADED = "downloaded"
+RESUMED = "resumed"
+UNCHANGED = "unchanged"
+
 class FastOpenDataPartitionedParquetIOManager(ConfigurableIOManager):
     base_dir: str
+    manifest_name: str = "manifest.json"  # Per-month listing of batch files, used when the server publishes one
+    probe_window: int = 8  # Speculative batch probes kept in flight per month when there is no manifest
+    # Downloads in flight across all months. The controller starts at initial_concurrency
+    # and adapts between min_concurrency and max_concurrency (AIMD).
+    initial_concurrency: int = 8
+    min_concurrency: int = 2
+    max_concurrency: int = 32
+    max_bytes_per_second: Optional[int] = None  # Optional bandwidth cap across all downloads
+    update_catalog: bool = True  # Record downloaded files in the lake catalog under base_dir
 
-    def __init__(self, base_dir: str):
-        super().__init__(base_dir=base_dir)
-        # Create a session once in the constructor
+    def __init__(self, base_dir: str, **config):
+        super().__init__(base_dir=base_dir, **config)
+        # Create a session once in the constructor, with a connection for every download slot
         self._session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=self.max_concurrency)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        # Serializes dropping a month's compaction when its first changed file arrives
+        self._compaction_lock = threading.Lock()
 
     def handle_output(self, context: OutputContext, obj):
         """
-        Download month-by-month partitioned data for the asset in parallel.
+        Download month-by-month partitioned data for the asset in parallel, through
+        one shared, adaptively sized pool of file downloads.
         """
         asset_name = context.asset_key.to_python_identifier()
         context.log.info(f"[FastOpenDataPartitionedParquetIOManager] handle_output for '{asset_name}'")
@@ -52,67 +83,200 @@ class FastOpenDataPartitionedParquetIOManager(ConfigurableIOManager):
                 current_month = 1
                 current_year += 1
 
-        downloaded_files_total = []
-
-        # 3) Download partitions in parallel using ThreadPoolExecutor
-        max_workers = 8  # Adjust concurrency based on your environment
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_partition = {}
-            for (yr, mo) in partitions:
-                future = executor.submit(self._download_partition, asset_name, yr, mo, context)
-                future_to_partition[future] = (yr, mo)
+        # 3) Download every file of every month through one shared work queue
+        controller = AdaptiveConcurrencyController(
+            initial=self.initial_concurrency,
+            minimum=self.min_concurrency,
+            maximum=self.max_concurrency,
+            max_bytes_per_second=self.max_bytes_per_second,
+        )
+        results_total = self._download_partitions(asset_name, partitions, controller, context)
 
-            for future in as_completed(future_to_partition):
-                result = future.result()  # list of downloaded file paths
-                downloaded_files_total.extend(result)
+        # 4) Bring the lake catalog in line with the months we just touched, or with
+        #    the whole asset the first time, so load_input can plan from it
+        if self.update_catalog:
+            catalog = LakeCatalog(self.base_dir)
+            if not catalog.is_synced(asset_name):
+                catalog.sync_asset(
+                    asset_name, os.path.join(self.base_dir, asset_name), "year=*/month=*/*.parquet"
+                )
+            else:
+                for (yr, mo) in partitions:
+                    catalog.sync_directory(
+                        asset_name,
+                        os.path.join(self.base_dir, asset_name, f"year={yr:04d}", f"month={mo:02d}"),
+                    )
 
+        unchanged = sum(1 for _, _, status in results_total if status == UNCHANGED)
         context.log.info(
-            f"[FastOpenDataPartitionedParquetIOManager] Downloaded {len(downloaded_files_total)} files "
-            f"total for asset '{asset_name}'."
+            f"[FastOpenDataPartitionedParquetIOManager] {len(results_total)} files total for asset "
+            f"'{asset_name}': {len(results_total) - unchanged} downloaded, {unchanged} unchanged, "
+            f"{controller.total_bytes} bytes transferred. Concurrency ended at {controller.limit} "
+            f"(peak {controller.peak_limit})."
         )
 
-    def _download_partition(self, asset_name: str, year: int, month: int, context):
+    def _download_partitions(self, asset_name: str, partitions, controller, context):
         """
-        Download all batch files for a single year-month partition of a given asset.
-        We rely on 404 to stop, but also add a maximum safety limit so we never hang.
+        Download all batch files for the given (year, month) partitions of an asset.
+
+        Work is scheduled per file, not per month, so one large month can't become
+        the tail of the run. Each month starts with a manifest job. If the server
+        publishes a manifest ({remote_dir}/{manifest_name}), it tells us exactly which
+        batch files exist, and all of them are queued. Otherwise we probe batch
+        numbers speculatively: `probe_window` GETs per month are in flight at once,
+        each file found queues the next batch number, and the first 404 marks the
+        end of the month. There is no separate HEAD per file; each GET both
+        discovers and downloads a file.
+
+        The thread pool is sized for max_concurrency, and `controller` decides how
+        many of those threads are actually downloading at any moment.
+
+        Months that were compacted since the last download (see compact_partition)
+        no longer hold their batch files, but every batch is still checked with a
+        conditional GET. If any of them changed or a new one appeared, the
+        compacted rows are stale, so the compaction is dropped and the month is
+        downloaded again in full.
+
+        Returns a list of ((year, month), local file path, status) for every file
+        that exists remotely.
         """
         # If you know a typical maximum batch count, set it here
         MAX_BATCH_PER_MONTH = 1000
 
-        remote_dir = f"https://fastopendata.org/{asset_name}/year={year:04d}/month={month:02d}/"
-        local_dir = os.path.join(self.base_dir, asset_name, f"year={year:04d}", f"month={month:02d}")
-        os.makedirs(local_dir, exist_ok=True)
+        dirs = {}
+        for (year, month) in partitions:
+            remote_dir = f"https://fastopendata.org/{asset_name}/year={year:04d}/month={month:02d}/"
+            local_dir = os.path.join(self.base_dir, asset_name, f"year={year:04d}", f"month={month:02d}")
+            recover_partition(local_dir)  # A compaction may have died mid-swap
+            os.makedirs(local_dir, exist_ok=True)
+            dirs[(year, month)] = (remote_dir, local_dir)
+        compacted = {partition for partition in partitions if read_compaction_marker(dirs[partition][1])}
 
-        downloaded = []
-        batch_num = 1
+        results = []
+        next_batch = {}  # Next batch number to probe, for months without a manifest
+        ended = set()  # Months whose probing has hit a 404
 
-        while batch_num <= MAX_BATCH_PER_MONTH:
-            file_name = f"{asset_name}_{year:04d}{month:02d}_{batch_num}.parquet"
-            file_url = remote_dir + file_name
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            pending = {}
 
-            resp_head = self._session.head(file_url)
-            if resp_head.status_code == 404:
-                # The server indicates no more files
-                break
-            if resp_head.status_code != 200:
-                context.log.warn(f"HTTP {resp_head.status_code} on {file_url}, aborting.")
-                break
+            def submit_file(partition, file_name, probed):
+                remote_dir, local_dir = dirs[partition]
+                local_file_path = os.path.join(local_dir, file_name)
+                future = executor.submit(
+                    self._download_with_slot, remote_dir + file_name, local_file_path, controller
+                )
+                pending[future] = ("file", partition, (file_name, local_file_path, probed))
 
-            local_file_path = os.path.join(local_dir, file_name)
-            self._download_file(file_url, local_file_path)
-            downloaded.append(local_file_path)
+            def submit_probe(partition):
+                year, month = partition
+                batch_num = next_batch[partition]
+                next_batch[partition] += 1
+                submit_file(partition, f"{asset_name}_{year:04d}{month:02d}_{batch_num}.parquet", True)
 
-            batch_num += 1
+            for partition in partitions:
+                future = executor.submit(self._fetch_manifest, dirs[partition][0])
+                pending[future] = ("manifest", partition, None)
 
-        if downloaded:
-            context.log.info(
-                f"  - Downloaded {len(downloaded)} files for {asset_name} year={year}, month={month}"
-            )
-        else:
-            context.log.debug(
-                f"  - No new files found for {asset_name} year={year}, month={month}"
+            try:
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        kind, partition, payload = pending.pop(future)
+                        if kind == "manifest":
+                            file_names = future.result()
+                            if file_names is not None:
+                                for file_name in file_names:
+                                    submit_file(partition, file_name, False)
+                            else:
+                                next_batch[partition] = 1
+                                for _ in range(min(self.probe_window, MAX_BATCH_PER_MONTH)):
+                                    submit_probe(partition)
+                            continue
+
+                        file_name, local_file_path, probed = payload
+                        status = future.result()
+                        if status is not None:
+                            results.append((partition, local_file_path, status))
+                            if probed and partition not in ended and next_batch[partition] <= MAX_BATCH_PER_MONTH:
+                                submit_probe(partition)
+                        elif probed:
+                            ended.add(partition)
+                        else:
+                            context.log.warn(
+                                f"{file_name} is listed in the manifest for {dirs[partition][0]} but returned 404."
+                            )
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+
+        stale = [
+            partition for partition in partitions
+            if partition in compacted
+            and any(status != UNCHANGED for p, _, status in results if p == partition)
+        ]
+        if stale:
+            context.log.info(f"  - Upstream files changed for compacted months {stale}, downloading them again.")
+            for partition in stale:
+                drop_compaction(dirs[partition][1])
+            results = [result for result in results if result[0] not in stale]
+            results += self._download_partitions(asset_name, stale, controller, context)
+
+        for (year, month) in partitions:
+            if (year, month) in stale:
+                continue  # Already logged by the second pass
+            statuses = [status for partition, _, status in results if partition == (year, month)]
+            transferred = sum(1 for status in statuses if status != UNCHANGED)
+            if transferred:
+                context.log.info(
+                    f"  - Downloaded {transferred} files for {asset_name} year={year}, month={month} "
+                    f"({len(statuses) - transferred} unchanged)"
+                )
+            else:
+                context.log.debug(
+                    f"  - No new files found for {asset_name} year={year}, month={month}"
+                )
+        return results
+
+    @retry(
+        reraise=True,
+        stop=stop_after_attempt(3),  # Same policy as _download_file
+        wait=wait_fixed(2),
+        retry=retry_if_exception_type(
+            (
+                requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.ConnectionError,
+                requests.exceptions.ReadTimeout,
             )
-        return downloaded
+        )
+    )
+    def _fetch_manifest(self, remote_dir: str):
+        """
+        Return the batch file names listed in a month's manifest, or None if the
+        server doesn't publish one. The manifest may be a JSON list, or an object
+        with a "files" list. Entries are either file names or {"name": ...} objects.
+        A response that isn't JSON (e.g. an HTML index or error page) also returns
+        None, so the month falls back to probing.
+        """
+        resp = self._session.get(remote_dir + self.manifest_name, timeout=(5, 30))
+        if resp.status_code != 200:
+            # No manifest published for this month (404, or 403 from some object stores)
+            return None
+
+        try:
+            payload = resp.json()
+        except ValueError:
+            return None
+        entries = payload.get("files", []) if isinstance(payload, dict) else payload
+        names = [entry["name"] if isinstance(entry, dict) else entry for entry in entries]
+        return [os.path.basename(name) for name in names if name.endswith(".parquet")]
+
+    def _download_with_slot(self, file_url: str, local_path: str, controller):
+        """
+        Run one download once the concurrency controller has a free slot.
+        """
+        with controller.slot():
+            return self._download_file(file_url, local_path, controller)
 
     @retry(
         reraise=True,
@@ -126,20 +290,151 @@ class FastOpenDataPartitionedParquetIOManager(ConfigurableIOManager):
             )
         )
     )
-    def _download_file(self, file_url: str, local_path: str):
+    def _download_file(self, file_url: str, local_path: str, controller=None):
         """
         Download a single file with retry, using the shared requests Session.
+
+        Each file has a sidecar record ({local_path}.meta.json) with the remote
+        size, ETag and Last-Modified of the copy we hold:
+          - If the local file is complete, the GET is conditional (If-None-Match /
+            If-Modified-Since), and a 304 skips the file without moving any bytes.
+          - If an earlier attempt was interrupted, the partial {local_path}.part is
+            resumed with a Range request. If-Range makes the server send the whole
+            file instead (200) when it changed in the meantime, and we start over.
+          - The finished .part file is renamed into place, so readers never see a
+            half-written file.
+          - Before anything is written into a compacted month, its compaction is
+            dropped (see drop_compaction), so the new copy never sits next to
+            compacted rows that already include the old one.
+
+        Returns DOWNLOADED, RESUMED or UNCHANGED, or None (writing nothing) if the
+        server answers 404. Retries after a dropped connection resume where the
+        previous attempt stopped.
+
+        If a `controller` is given, it is told about latency, errors and streamed
+        bytes, and it paces the stream when a bandwidth cap is set.
         """
-        with self._session.get(file_url, stream=True, timeout=(5, 30)) as r:
-            r.raise_for_status()
-            with open(local_path, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
+        tmp_path = f"{local_path}.part"
+        record_path = f"{local_path}.meta.json"
+        record = self._read_record(record_path)
+        validator = record.get("etag") or record.get("last_modified")
+
+        headers = {}
+        # A compacted file's rows live on in the month's compacted file, not at local_path
+        held = record.get("compacted") or self._local_size(local_path) == record.get("size")
+        if record.get("complete") and held:
+            if record.get("etag"):
+                headers["If-None-Match"] = record["etag"]
+            if record.get("last_modified"):
+                headers["If-Modified-Since"] = record["last_modified"]
+        elif validator and self._local_size(tmp_path):
+            offset = self._local_size(tmp_path)
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = validator
+
+        try:
+            started = time.monotonic()
+            with self._session.get(file_url, headers=headers, stream=True, timeout=(5, 30)) as r:
+                if controller is not None:
+                    controller.record_latency(time.monotonic() - started)
+                if r.status_code == 404:
+                    return None
+                if r.status_code == 304:
+                    return UNCHANGED
+                if r.status_code == 416:
+                    # The partial file is no longer a prefix of the remote one
+                    os.remove(tmp_path)
+                    return self._download_file(file_url, local_path, controller)
+                if controller is not None and (r.status_code == 429 or r.status_code >= 500):
+                    controller.record_error()
+                r.raise_for_status()
+
+                # New bytes are about to land next to the month's compacted files, which
+                # may already hold this file's old rows. Drop the compaction first, so
+                # readers never see rows twice and an interrupted run can't leave them so.
+                partition_dir = os.path.dirname(local_path)
+                with self._compaction_lock:
+                    if read_compaction_marker(partition_dir):
+                        drop_compaction(partition_dir)
+
+                resuming = r.status_code == 206
+                if resuming:
+                    expected_size = int(r.headers["Content-Range"].rsplit("/", 1)[1])
+                else:
+                    content_length = r.headers.get("Content-Length")
+                    expected_size = int(content_length) if content_length else None
+                    # Record the validators before streaming, so an interrupted download can resume
+                    record = {
+                        "url": file_url,
+                        "etag": r.headers.get("ETag"),
+                        "last_modified": r.headers.get("Last-Modified"),
+                        "size": expected_size,
+                        "complete": False,
+                    }
+                    self._write_record(record_path, record)
+
+                with open(tmp_path, "ab" if resuming else "wb") as f:
+                    for chunk in r.iter_content(chunk_size=8192):
+                        if controller is not None:
+                            controller.consume(len(chunk))
+                        f.write(chunk)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError):
+            if controller is not None:
+                controller.record_error()
+            raise
+
+        size = self._local_size(tmp_path)
+        if expected_size is not None and size != expected_size:
+            # Let the retry decorator pick this up and resume from what we have
+            raise requests.exceptions.ChunkedEncodingError(
+                f"{file_url}: got {size} of {expected_size} bytes"
+            )
+        os.replace(tmp_path, local_path)
+        record["size"] = size
+        record["complete"] = True
+        self._write_record(record_path, record)
+        return RESUMED if resuming else DOWNLOADED
+
+    @staticmethod
+    def _local_size(path: str):
+        return os.path.getsize(path) if os.path.exists(path) else None
+
+    @staticmethod
+    def _read_record(record_path: str) -> dict:
+        try:
+            with open(record_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _write_record(record_path: str, record: dict) -> None:
+        tmp_path = f"{record_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, record_path)
 
     def load_input(self, context: InputContext):
         """
-        If you need to load the data. This example will load everything
-        that handle_output just downloaded.
+        Lazily scan what handle_output downloaded, as a pl.LazyFrame over
+        base_dir/asset_name/year=YYYY/month=MM/*.parquet with hive partitioning.
+        `year` and `month` come back as columns, so downstream filters on them (and
+        column selections) are pushed down, and only the files and columns a query
+        needs are read.
+
+        The input's metadata can narrow the scan up front:
+            AssetIn(metadata={"partitions": ["2024-01", "2024-02"], "columns": [...]})
+        "partitions" lists year-month keys, and only those month directories are scanned.
+        Without it, a partitioned input (e.g. a downstream monthly asset) scans just
+        the month partitions Dagster asked for. Each month is scanned on its own with
+        `year` and `month` added as literal columns: with one month (or months of one
+        year) the hive keys would sit in the paths' common prefix, where Polars
+        doesn't parse them.
+
+        Which files to scan comes from the lake catalog once it lists the whole
+        asset, so planning a scan doesn't walk hundreds of month directories. Until
+        then, the month directories are globbed.
         """
         # Only import polars here to avoid global dependency
         import polars as pl
@@ -149,15 +444,69 @@ class FastOpenDataPartitionedParquetIOManager(ConfigurableIOManager):
         if not os.path.exists(local_asset_dir):
             return None
 
-        # Recursively find all .parquet
-        parquet_paths = []
-        for root, dirs, files in os.walk(local_asset_dir):
-            for file in files:
-                if file.endswith(".parquet"):
-                    parquet_paths.append(os.path.join(root, file))
-
-        if not parquet_paths:
+        metadata = context.definition_metadata or {}
+        partitions = metadata.get("partitions")
+        if not partitions and context.has_asset_partitions:
+            # Monthly partition keys look like "2024-01-01"
+            partitions = context.asset_partition_keys
+        months = None
+        if partitions:
+            months = [tuple(int(part) for part in str(partition).split("-")[:2]) for partition in partitions]
+        month_files = self._plan_month_files(asset_name, local_asset_dir, months)
+        sources = [path for paths in month_files.values() for path in paths]
+        if not sources:
             return None
 
-        dfs = [pl.read_parquet(p) for p in sorted(parquet_paths)]
-        return pl.concat(dfs) if dfs else None
+        if months:
+            lf = pl.concat(
+                [
+                    pl.scan_parquet(paths, hive_partitioning=False).with_columns(
+                        pl.lit(year, dtype=pl.Int32).alias("year"),
+                        pl.lit(month, dtype=pl.Int32).alias("month"),
+                    )
+                    for (year, month), paths in month_files.items()
+                ],
+                how="diagonal_relaxed",
+            )
+        else:
+            lf = pl.scan_parquet(
+                sources,
+                hive_partitioning=True,
+                hive_schema={"year": pl.Int32, "month": pl.Int32},
+            )
+        if metadata.get("columns"):
+            lf = lf.select(metadata["columns"])
+
+        context.log.info(
+            f"[FastOpenDataPartitionedParquetIOManager] Scanning {len(sources)} file(s) "
+            f"for asset '{asset_name}' lazily."
+        )
+        return lf
+
+    def _plan_month_files(self, asset_name: str, local_asset_dir: str, months=None):
+        """
+        {(year, month): [file paths]} for the asset, limited to `months` when given,
+        in month order. Read from the lake catalog when it lists the whole asset,
+        otherwise globbed from the month directories.
+        """
+        month_files = {}
+        catalog = LakeCatalog(self.base_dir) if self.update_catalog else None
+        if catalog is not None and catalog.is_synced(asset_name):
+            for entry in catalog.files(asset_name):
+                values = entry["partition_values"]
+                key = (int(values["year"]), int(values["month"]))
+                month_files.setdefault(key, []).append(entry["path"])
+        elif months:
+            for (year, month) in months:
+                month_dir = os.path.join(local_asset_dir, f"year={year:04d}", f"month={month:02d}")
+                paths = sorted(glob.glob(os.path.join(month_dir, "*.parquet")))
+                if paths:
+                    month_files[(year, month)] = paths
+        else:
+            for path in sorted(glob.glob(os.path.join(local_asset_dir, "year=*", "month=*", "*.parquet"))):
+                values = dict(part.split("=", 1) for part in path.split(os.sep)[-3:-1])
+                month_files.setdefault((int(values["year"]), int(values["month"])), []).append(path)
+
+        if months:
+            month_files = {key: month_files[key] for key in months if key in month_files}
+        return dict(sorted(month_files.items()))
@@ -2,8 +2,22 @@
 
 import os
 import polars as pl
+from typing import Union
 from dagster import ConfigurableIOManager, OutputContext, InputContext
 
+from pipeline.utils.dtype_optimization import resolve_storage_dtypes
+from pipeline.utils.lake_catalog import LakeCatalog
+from pipeline.utils.parquet_page_writer import ParquetPageWriter
+
+
+def single_file_parquet_path(base_dir: str, asset_name: str) -> str:
+    """
+    Where SingleFilePolarsParquetIOManager keeps an asset's file:
+        {base_dir}/{asset_name}/{asset_name}.parquet
+    """
+    return os.path.join(base_dir, asset_name, f"{asset_name}.parquet")
+
+
 class SingleFilePolarsParquetIOManager(ConfigurableIOManager):
     """
     A single I/O manager that stores exactly one Polars DataFrame per asset
@@ -12,36 +26,79 @@ class SingleFilePolarsParquetIOManager(ConfigurableIOManager):
 
     For example, if the asset_key is "my_asset", we store:
         {base_dir}/my_asset/my_asset.parquet
+
+    Assets that page through large sources can return a ParquetPageWriter
+    instead of a DataFrame. Its staged part files are then streamed into the
+    same single file without loading the whole dataset into memory.
+
+    Before writing, columns are cast to the compact storage dtypes the asset
+    declares in its "storage_dtypes" metadata (see
+    pipeline/utils/dtype_optimization.py), and the bytes saved are added to the
+    asset's output metadata. Undeclared columns are written as they are.
+
+    Every write is also recorded in the lake catalog (pipeline/utils/lake_catalog.py).
     """
 
     base_dir: str  # The base directory in which to store subfolders
+    compact_dtypes: bool = True  # Cast to the asset's declared storage dtypes before writing
+    update_catalog: bool = True  # Record written files in the lake catalog under base_dir
 
-    def handle_output(self, context: OutputContext, obj: pl.DataFrame):
+    def handle_output(self, context: OutputContext, obj: Union[pl.DataFrame, ParquetPageWriter]):
         """
-        Writes a single Polars DataFrame to a single .parquet file.
-        The file is named {asset_name}.parquet in the subdirectory
-        {base_dir}/{asset_name}.
+        Writes a single Polars DataFrame (or a ParquetPageWriter's staged parts)
+        to a single .parquet file. The file is named {asset_name}.parquet in the
+        subdirectory {base_dir}/{asset_name}.
         """
         if obj is None:
             context.log.info("No data to write (None).")
             return
 
-        if not isinstance(obj, pl.DataFrame):
+        if not isinstance(obj, (pl.DataFrame, ParquetPageWriter)):
             raise ValueError(
-                f"Expected a Polars DataFrame, got {type(obj)}. "
+                f"Expected a Polars DataFrame or ParquetPageWriter, got {type(obj)}. "
                 "This I/O manager only supports single-file Polars DataFrames."
             )
 
         asset_name = context.asset_key.to_python_identifier()
-        dir_path = os.path.join(self.base_dir, asset_name)
-        os.makedirs(dir_path, exist_ok=True)
+        file_path = single_file_parquet_path(self.base_dir, asset_name)  # e.g. ".../daily_weather_asset/daily_weather_asset.parquet"
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+        dtypes = {}
+        if self.compact_dtypes:
+            schema = obj.scan().collect_schema() if isinstance(obj, ParquetPageWriter) else obj.schema
+            dtypes = resolve_storage_dtypes((context.definition_metadata or {}).get("storage_dtypes"), schema)
+
+        if isinstance(obj, ParquetPageWriter):
+            # Staged parts are already on disk, so compare parquet bytes before and after
+            bytes_before = obj.staged_bytes()
+            obj.finalize(file_path, dtypes=dtypes)
+            bytes_after = os.path.getsize(file_path)
+            bytes_measure = "parquet on disk"
+            row_count = obj.row_count
+        else:
+            compact_df = obj.cast(dtypes)
+            bytes_before = obj.estimated_size()
+            bytes_after = compact_df.estimated_size()
+            bytes_measure = "in-memory estimate"
+            compact_df.write_parquet(file_path)
+            row_count = len(obj)
+
+        if self.compact_dtypes:
+            context.add_output_metadata(
+                {
+                    "compacted_dtypes": str({name: str(dtype) for name, dtype in dtypes.items()}),
+                    "bytes_before_compaction": bytes_before,
+                    "bytes_after_compaction": bytes_after,
+                    "bytes_saved": bytes_before - bytes_after,
+                    "bytes_measure": bytes_measure,
+                }
+            )
 
-        file_name = f"{asset_name}.parquet"  # e.g. "daily_weather_asset.parquet"
-        file_path = os.path.join(dir_path, file_name)
+        if self.update_catalog:
+            LakeCatalog(self.base_dir).sync_asset(asset_name, os.path.dirname(file_path))
 
-        obj.write_parquet(file_path)
         context.log.info(
-            f"[SingleFilePolarsParquetIOManager] Wrote {len(obj)} rows "
+            f"[SingleFilePolarsParquetIOManager] Wrote {row_count} rows "
             f"to {file_path}"
         )
 
@@ -50,8 +107,7 @@ class SingleFilePolarsParquetIOManager(ConfigurableIOManager):
         Reads the single .parquet file from base_dir/asset_name/asset_name.parquet
         """
         asset_name = context.asset_key.to_python_identifier()
-        file_name = f"{asset_name}.parquet"
-        file_path = os.path.join(self.base_dir, asset_name, file_name)
+        file_path = single_file_parquet_path(self.base_dir, asset_name)
 
         if not os.path.exists(file_path):
             raise FileNotFoundError(
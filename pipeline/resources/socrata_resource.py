@@ -1,20 +1,124 @@
 # pipeline/resources/socrata_resource.py
 
+import functools
+import io
+import json
+import os
+import threading
 import requests
+import polars as pl
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-from dagster import ConfigurableResource, EnvVar
-from typing import Any, Dict, List
+from dagster import ConfigurableResource, EnvVar, InitResourceContext
+from pydantic import PrivateAttr
+from pipeline.utils.http_cache import HttpResponseCache
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 
 class SocrataResource(ConfigurableResource):
     """
     A reusable, configurable resource for fetching data from Socrata.
     Reads 'api_token' from an environment variable: SOCRATA_API_TOKEN.
+
+    The resource owns one pooled requests.Session for its whole lifetime, so
+    consecutive pages and datasets reuse the same TCP/TLS connections.
+    When cache_dir is set, responses also go through an on-disk HttpResponseCache,
+    which logs to the run's Dagster logger.
     """
 
     api_token: str = EnvVar("SOCRATA_API_TOKEN")
 
+    # Connection pool settings
+    pool_maxsize: int = 16          # Max open connections per host, also caps concurrent page fetches
+
+    # Retry settings for transient connection and status errors
+    max_retries: int = 5
+    backoff_factor: float = 1.0     # Exponential backoff: 1s, 2s, 4s, etc.
+    status_forcelist: List[int] = [429, 500, 502, 503, 504]
+    respect_retry_after: bool = True  # Sleep for the server's Retry-After on 429/503 instead of our own backoff
+
+    # Request timeouts (seconds)
+    connect_timeout: float = 10.0
+    read_timeout: float = 300.0
+
+    # Optional on-disk response cache (see pipeline/utils/http_cache.py). None disables it.
+    cache_dir: Optional[str] = None
+    cache_max_bytes: int = 2 * 1024 ** 3
+    cache_ttl_seconds: float = 3600
+    cache_serve_stale_on_error: bool = False  # Serve stale cached pages when offline; for local iteration only
+
+    _session: Optional[requests.Session] = PrivateAttr(default=None)
+    _session_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _cache: Optional[HttpResponseCache] = PrivateAttr(default=None)
+    _logger: Any = PrivateAttr(default=None)
+
+    def setup_for_execution(self, context: InitResourceContext) -> None:
+        self._logger = context.log
+        self._get_session()
+
+    def teardown_after_execution(self, context: InitResourceContext) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Close the pooled session and release its connections.
+        """
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def _get_session(self) -> requests.Session:
+        """
+        Return the pooled session, building it on first use.
+        """
+        with self._session_lock:
+            if self._session is None:
+                retry_strategy = Retry(
+                    total=self.max_retries,
+                    backoff_factor=self.backoff_factor,
+                    status_forcelist=self.status_forcelist,
+                    allowed_methods=["GET"],
+                    respect_retry_after_header=self.respect_retry_after,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=self.pool_maxsize,
+                    pool_maxsize=self.pool_maxsize,
+                    max_retries=retry_strategy,
+                )
+
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update({"X-App-Token": self.api_token})
+                self._session = session
+
+                if self.cache_dir and self._cache is None:
+                    self._cache = HttpResponseCache(
+                        self.cache_dir,
+                        max_bytes=self.cache_max_bytes,
+                        ttl_seconds=self.cache_ttl_seconds,
+                        logger=self._logger,
+                        serve_stale_on_error=self.cache_serve_stale_on_error,
+                    )
+            return self._session
+
+    def _get(self, url: str, query_params: Dict[str, Any]) -> bytes:
+        """
+        GET through the pooled session (and the response cache, if enabled)
+        and return the body. Raises for non-2xx responses.
+        """
+        session = self._get_session()
+        timeout = (self.connect_timeout, self.read_timeout)
+        if self._cache is not None:
+            return self._cache.fetch(url, query_params, session=session, timeout=timeout)
+
+        resp = session.get(url, params=query_params, timeout=timeout)
+        resp.raise_for_status()
+        return resp.content
+
     def fetch_data(
         self,
         endpoint: str,
@@ -25,40 +129,268 @@ class SocrataResource(ConfigurableResource):
         Retries certain transient errors automatically.
         Returns a list of records (dicts).
         """
+        payload = json.loads(self._get(endpoint, query_params))
 
-        # Create a retry strategy that will retry on certain connection or status errors
-        retry_strategy = Retry(
-            total=5,                # Max number of retries
-            backoff_factor=1,       # Exponential backoff: 1s, 2s, 4s, etc.
-            status_forcelist=[429, 500, 502, 503, 504],
-            # Note: "allowed_methods" is only available in urllib3 >= 1.26. By default, it includes
-            # GET, PUT, PATCH, DELETE, HEAD, OPTIONS. If you need to allow or restrict methods, do so here.
-            allowed_methods=["GET"],
-        )
+        # If it's a .geojson endpoint, handle differently
+        if endpoint.endswith(".geojson"):
+            feats = payload.get("features", [])
+            return [feat.get("properties", {}) for feat in feats]
+        else:
+            return payload
 
-        # Create a custom HTTP adapter with our retry strategy
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+    def fetch_row_count(self, endpoint: str, where: Optional[str] = None) -> int:
+        """
+        Ask Socrata how many rows match the (optional) $where filter,
+        using a single $select=count(*) request.
+        """
+        params = {"$select": "count(*) AS row_count"}
+        if where:
+            params["$where"] = where
 
-        # Build a session and mount the adapter
-        session = requests.Session()
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
+        data = self.fetch_data(endpoint, params)
+        if not data:
+            return 0
+        return int(data[0].get("row_count", 0))
 
-        headers = {"X-App-Token": self.api_token}
+    def fetch_raw(
+        self,
+        endpoint: str,
+        query_params: Dict[str, Any],
+        response_format: str = "json",
+    ) -> bytes:
+        """
+        Fetch one page from a Socrata endpoint and return the undecoded body.
+        response_format="csv" requests the .csv form of the endpoint.
+        """
+        if response_format not in ("json", "csv"):
+            raise ValueError(f"Unsupported response format '{response_format}'. Use 'json' or 'csv'.")
 
-        try:
-            resp = session.get(endpoint, params=query_params, headers=headers)
-            resp.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            # You may want more granular error handling/logging here
-            raise e
-        finally:
-            # Always close the session to free up resources
-            session.close()
+        url = _csv_endpoint(endpoint) if response_format == "csv" else endpoint
+        return self._get(url, query_params)
 
-        # If it's a .geojson endpoint, handle differently
-        if endpoint.endswith(".geojson"):
-            feats = resp.json().get("features", [])
-            return [feat.get("properties", {}) for feat in feats]
+    def fetch_frame(
+        self,
+        endpoint: str,
+        query_params: Dict[str, Any],
+        response_format: str = "json",
+        schema: Optional[Dict[str, pl.DataType]] = None,
+    ) -> pl.DataFrame:
+        """
+        Fetch one page from a Socrata endpoint straight into a Polars DataFrame.
+        See decode_page for how each response format is parsed.
+        """
+        return decode_page(self.fetch_raw(endpoint, query_params, response_format), response_format, schema)
+
+    def iter_pages(
+        self,
+        endpoint: str,
+        query_params: Dict[str, Any],
+        page_size: int = 50000,
+        pagination: str = "offset",
+        max_workers: int = 4,
+        key: Optional[str] = None,
+        response_format: str = "json",
+        schema: Optional[Dict[str, pl.DataType]] = None,
+        decode: bool = True,
+        start_cursor: Optional[Dict[str, Any]] = None,
+        with_cursor: bool = False,
+    ) -> Iterator[Any]:
+        """
+        Yield pages from a Socrata endpoint as Polars DataFrames, in order.
+
+        pagination="offset" walks $offset one page at a time.
+        pagination="concurrent" counts the matching rows first and then fetches
+        the $offset windows in parallel with at most `max_workers` requests in flight.
+        pagination="keyset" seeks past the last (key, :id) seen instead of using
+        $offset, so every page costs the same and rows can't shift between pages.
+
+        For the offset modes, query_params should carry an $order so that offset
+        windows are stable. Keyset mode sets its own $order from `key`.
+        response_format and schema are passed through to decode_page.
+
+        With decode=False the offset modes yield each page's raw body instead, so
+        decoding can happen elsewhere (see pipeline/utils/staged_ingestion.py).
+        Keyset mode always decodes, because it needs each page's last row to seek.
+
+        With with_cursor=True each item is a (page, cursor) tuple. The cursor is a
+        small JSON-serializable dict describing where the next page starts.
+        Passing it back as start_cursor resumes the walk right after that page.
+        """
+        if decode or pagination == "keyset":
+            fetch_page = functools.partial(
+                self.fetch_frame, endpoint, response_format=response_format, schema=schema
+            )
+            is_empty = pl.DataFrame.is_empty
         else:
-            return resp.json()
+            fetch_page = functools.partial(self.fetch_raw, endpoint, response_format=response_format)
+            is_empty = functools.partial(_payload_is_empty, response_format=response_format)
+
+        start_cursor = start_cursor or {}
+        if pagination == "offset":
+            pages = self._iter_offset_pages(
+                fetch_page, is_empty, query_params, page_size, offset=start_cursor.get("offset", 0)
+            )
+        elif pagination == "concurrent":
+            # More workers than pooled connections would just churn connections
+            max_workers = max(1, min(max_workers, self.pool_maxsize))
+            total_rows = self.fetch_row_count(endpoint, query_params.get("$where"))
+            pages = self._iter_concurrent_pages(
+                fetch_page, is_empty, query_params, page_size, max_workers, total_rows,
+                start_offset=start_cursor.get("offset", 0),
+            )
+        elif pagination == "keyset":
+            if not key:
+                raise ValueError("Keyset pagination needs a 'key' column to seek on.")
+            pages = self._iter_keyset_pages(
+                fetch_page, query_params, page_size, key,
+                last_key=start_cursor.get("last_key"), last_id=start_cursor.get("last_id"),
+            )
+        else:
+            raise ValueError(
+                f"Unsupported pagination mode '{pagination}'. Use 'offset', 'concurrent' or 'keyset'."
+            )
+
+        if with_cursor:
+            return pages
+        return (page for page, _ in pages)
+
+    def _iter_offset_pages(
+        self,
+        fetch_page: Callable[[Dict[str, Any]], Any],
+        is_empty: Callable[[Any], bool],
+        query_params: Dict[str, Any],
+        page_size: int,
+        offset: int = 0,
+    ) -> Iterator[Tuple[Any, Dict[str, Any]]]:
+        while True:
+            params = {**query_params, "$limit": page_size, "$offset": offset}
+            page = fetch_page(params)
+            if is_empty(page):
+                return
+            offset += page_size
+            yield page, {"offset": offset}
+
+    def _iter_concurrent_pages(
+        self,
+        fetch_page: Callable[[Dict[str, Any]], Any],
+        is_empty: Callable[[Any], bool],
+        query_params: Dict[str, Any],
+        page_size: int,
+        max_workers: int,
+        total_rows: int,
+        start_offset: int = 0,
+    ) -> Iterator[Tuple[Any, Dict[str, Any]]]:
+        offsets = range(start_offset, total_rows, page_size)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Futures are kept in offset order, so popping from the left
+            # reassembles the pages in the same order as a sequential walk.
+            pending = deque()
+            for offset in offsets:
+                params = {**query_params, "$limit": page_size, "$offset": offset}
+                pending.append((offset, executor.submit(fetch_page, params)))
+                if len(pending) >= max_workers:
+                    offset_done, future = pending.popleft()
+                    yield future.result(), {"offset": offset_done + page_size}
+            while pending:
+                offset_done, future = pending.popleft()
+                yield future.result(), {"offset": offset_done + page_size}
+
+        # Rows appended upstream after the count are picked up by a sequential tail walk
+        yield from self._iter_offset_pages(
+            fetch_page, is_empty, query_params, page_size, offset=start_offset + len(offsets) * page_size
+        )
+
+    def _iter_keyset_pages(
+        self,
+        fetch_page: Callable[[Dict[str, Any]], pl.DataFrame],
+        query_params: Dict[str, Any],
+        page_size: int,
+        key: str,
+        last_key: Optional[str] = None,
+        last_id: Optional[str] = None,
+    ) -> Iterator[Tuple[pl.DataFrame, Dict[str, Any]]]:
+        # :id is Socrata's unique row identifier. Ordering on (key, :id) makes the
+        # seek position unique even when many rows share the same key value.
+        base_where = query_params.get("$where")
+
+        while True:
+            where = base_where
+            if last_key is not None:
+                seek = (
+                    f"({key} > {_soql_literal(last_key)} OR "
+                    f"({key} = {_soql_literal(last_key)} AND :id > {_soql_literal(last_id)}))"
+                )
+                where = f"({base_where}) AND {seek}" if base_where else seek
+
+            params = {
+                **query_params,
+                "$select": ":id, *",
+                "$order": f"{key} ASC, :id ASC",
+                "$limit": page_size,
+            }
+            params.pop("$offset", None)
+            if where:
+                params["$where"] = where
+
+            page = fetch_page(params)
+            if page.is_empty():
+                return
+
+            last_key = page[key][-1] if key in page.columns else None
+            last_id = page[":id"][-1] if ":id" in page.columns else None
+            if last_key is None or last_id is None:
+                raise ValueError(
+                    f"Keyset pagination on '{key}' needs a non-null '{key}' and ':id' on every row."
+                )
+
+            last_key, last_id = str(last_key), str(last_id)
+            yield page.drop(":id"), {"last_key": last_key, "last_id": last_id}
+
+
+def decode_page(
+    content: bytes,
+    response_format: str = "json",
+    schema: Optional[Dict[str, pl.DataType]] = None,
+) -> pl.DataFrame:
+    """
+    Decode a raw Socrata page body into a Polars DataFrame.
+
+    CSV bodies go straight into Polars' native CSV reader, skipping the Python
+    list-of-dicts that the JSON path builds. Columns named in `schema` get that
+    dtype, and every other column is read as a string, just like the JSON path.
+    This is a module-level function so that worker processes can call it.
+    """
+    if response_format == "json":
+        return pl.DataFrame(json.loads(content))
+    if response_format == "csv":
+        if not content.strip():
+            return pl.DataFrame()
+        return pl.read_csv(io.BytesIO(content), schema_overrides=schema, infer_schema=False)
+    raise ValueError(f"Unsupported response format '{response_format}'. Use 'json' or 'csv'.")
+
+
+def _payload_is_empty(content: bytes, response_format: str) -> bool:
+    """
+    An empty JSON page is "[]". An empty CSV page has only its header line.
+    """
+    body = content.strip()
+    if response_format == "csv":
+        return b"\n" not in body
+    return body in (b"", b"[]")
+
+
+def _csv_endpoint(endpoint: str) -> str:
+    """
+    Swap a Socrata resource endpoint's extension for .csv,
+    e.g. .../resource/vxuj-8kew.json -> .../resource/vxuj-8kew.csv
+    """
+    base, _ = os.path.splitext(endpoint)
+    return f"{base}.csv"
+
+
+def _soql_literal(value: Any) -> str:
+    """
+    Quote a value as a SoQL string literal, doubling any embedded single quotes.
+    """
+    return "'" + str(value).replace("'", "''") + "'"
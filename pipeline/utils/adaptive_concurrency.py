@@ -0,0 +1,128 @@
+# pipeline/utils/adaptive_concurrency.py
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+
+class AdaptiveConcurrencyController:
+    """
+    An AIMD (additive increase, multiplicative decrease) limit on how many
+    downloads run at once.
+
+    Workers wrap each request in `with controller.slot():`. Callers block while
+    `limit` requests are already running. Completions are grouped into windows of
+    `limit` requests, and at the end of each window:
+      - any error (connection drop, 429, 5xx) or a latency spike (time to first
+        byte above `latency_spike_factor` x the running baseline) multiplies the
+        limit by `decrease_factor`;
+      - otherwise, if throughput improved by at least `min_gain` over the previous
+        window, the limit grows by one;
+      - otherwise the limit stays where it is, because more connections weren't helping.
+
+    If `max_bytes_per_second` is set, consume() also paces the streamed bytes
+    across all workers to that rate.
+    """
+
+    def __init__(
+        self,
+        initial: int = 8,
+        minimum: int = 2,
+        maximum: int = 32,
+        decrease_factor: float = 0.5,
+        min_gain: float = 0.05,
+        latency_spike_factor: float = 3.0,
+        max_bytes_per_second: Optional[int] = None,
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = max(minimum, min(initial, maximum))
+        self.decrease_factor = decrease_factor
+        self.min_gain = min_gain
+        self.latency_spike_factor = latency_spike_factor
+        self.max_bytes_per_second = max_bytes_per_second
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._baseline_latency: Optional[float] = None
+
+        self._window_started = time.monotonic()
+        self._window_completed = 0
+        self._window_bytes = 0
+        self._window_congested = False
+        self._last_throughput: Optional[float] = None
+
+        self._bandwidth_lock = threading.Lock()
+        self._next_send_time = time.monotonic()
+
+        self.total_bytes = 0
+        self.peak_limit = self.limit
+
+    @contextmanager
+    def slot(self):
+        with self._cond:
+            while self._in_flight >= self.limit:
+                self._cond.wait()
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._window_completed += 1
+                if self._window_completed >= self.limit:
+                    self._end_window()
+                self._cond.notify_all()
+
+    def record_latency(self, seconds: float) -> None:
+        """
+        Report the time to first byte of a request.
+        """
+        with self._cond:
+            if self._baseline_latency is None:
+                self._baseline_latency = seconds
+                return
+            if seconds > self.latency_spike_factor * self._baseline_latency:
+                self._window_congested = True
+            # Slow-moving average, so one spike doesn't become the new normal
+            self._baseline_latency = 0.9 * self._baseline_latency + 0.1 * seconds
+
+    def record_error(self) -> None:
+        with self._cond:
+            self._window_congested = True
+
+    def consume(self, num_bytes: int) -> None:
+        """
+        Count streamed bytes, sleeping first if that would exceed the bandwidth cap.
+        """
+        with self._cond:
+            self._window_bytes += num_bytes
+            self.total_bytes += num_bytes
+        if not self.max_bytes_per_second:
+            return
+        with self._bandwidth_lock:
+            now = time.monotonic()
+            send_at = max(now, self._next_send_time)
+            self._next_send_time = send_at + num_bytes / self.max_bytes_per_second
+        if send_at > now:
+            time.sleep(send_at - now)
+
+    def _end_window(self) -> None:
+        """
+        Adjust the limit from the window that just finished. Caller holds self._cond.
+        """
+        elapsed = max(time.monotonic() - self._window_started, 1e-6)
+        throughput = self._window_bytes / elapsed
+
+        if self._window_congested:
+            self.limit = max(self.minimum, int(self.limit * self.decrease_factor))
+        elif self._last_throughput is None or throughput >= self._last_throughput * (1 + self.min_gain):
+            self.limit = min(self.maximum, self.limit + 1)
+        self.peak_limit = max(self.peak_limit, self.limit)
+
+        self._last_throughput = throughput
+        self._window_started = time.monotonic()
+        self._window_completed = 0
+        self._window_bytes = 0
+        self._window_congested = False
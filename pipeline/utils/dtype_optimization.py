@@ -0,0 +1,57 @@
+# pipeline/utils/dtype_optimization.py
+
+from typing import Any, Dict, Mapping, Optional
+
+import polars as pl
+
+
+# Storage dtypes an asset can declare, by name, in its "storage_dtypes" metadata
+STORAGE_DTYPES = {
+    "Int8": pl.Int8,
+    "Int16": pl.Int16,
+    "Int32": pl.Int32,
+    "Int64": pl.Int64,
+    "Float32": pl.Float32,
+    "Float64": pl.Float64,
+    "Boolean": pl.Boolean,
+    "Date": pl.Date,
+    "Utf8": pl.Utf8,
+    "Categorical": pl.Categorical,
+}
+
+
+def storage_dtype_names(dtypes: Mapping[str, pl.DataType]) -> Dict[str, str]:
+    """
+    Turn {column: dtype} into the {column: dtype name} form that goes into an
+    asset's "storage_dtypes" metadata, e.g.
+
+        @asset(metadata={"storage_dtypes": storage_dtype_names({"trips": pl.Int32})})
+    """
+    names = {}
+    for column, dtype in dtypes.items():
+        name = next((name for name, candidate in STORAGE_DTYPES.items() if dtype == candidate), None)
+        if name is None:
+            raise ValueError(f"Unsupported storage dtype {dtype} for column '{column}'.")
+        names[column] = name
+    return names
+
+
+def resolve_storage_dtypes(declared: Optional[Any], schema: pl.Schema) -> Dict[str, pl.DataType]:
+    """
+    The casts needed to bring a frame with `schema` to an asset's declared storage
+    dtypes. `declared` is the "storage_dtypes" metadata value ({column: dtype
+    name}, possibly wrapped in a Dagster metadata value). Only declared columns
+    present in the frame and not already of the declared dtype are returned.
+
+    The storage dtypes are fixed per column rather than inferred from each run's
+    values, so the stored schema is the same on every run.
+    """
+    declared = getattr(declared, "value", declared) or {}
+    casts = {}
+    for column, name in declared.items():
+        if name not in STORAGE_DTYPES:
+            raise ValueError(f"Unknown storage dtype '{name}' for column '{column}'.")
+        dtype = STORAGE_DTYPES[name]
+        if column in schema and schema[column] != dtype:
+            casts[column] = dtype
+    return casts
@@ -61,10 +61,11 @@ class DuckDBWrapper:
             except Exception as e:
                 print(f"Skipping {table_name}: encountered error => {e}")
 
-    def register_data_table(self, paths, table_names):
+    def register_data_table(self, paths, table_names, order_by=None):
         """
         Registers local data files (Parquet, CSV, JSON) as tables in DuckDB with error skipping.
-        Uses CREATE OR REPLACE to overwrite existing tables.
+        Uses CREATE OR REPLACE to overwrite existing tables. If order_by (a list of columns)
+        is given, rows are stored sorted on it so DuckDB's zone maps can skip row groups.
         """
         if len(paths) != len(table_names):
             raise ValueError("The number of paths must match the number of table names.")
@@ -86,6 +87,8 @@ class DuckDBWrapper:
                     query = f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM read_json_auto('{path_str}')"
                 else:
                     raise ValueError(f"Unsupported file type '{file_extension}' for file: {path_str}")
+                if order_by:
+                    query += f" ORDER BY {', '.join(order_by)}"
 
                 self.con.execute(query)
                 self.registered_tables.append(table_name)
@@ -130,10 +133,11 @@ class DuckDBWrapper:
         except Exception as e:
             print(f"Skipping partitioned {table_name}: encountered error => {e}")
 
-    def register_partitioned_data_table(self, base_path, table_name, wildcard="*/*/*.parquet"):
+    def register_partitioned_data_table(self, base_path, table_name, wildcard="*/*/*.parquet", order_by=None):
         """
         Registers partitioned Parquet data as a table using Hive partitioning with error skipping.
-        Uses CREATE OR REPLACE to overwrite existing tables.
+        Uses CREATE OR REPLACE to overwrite existing tables. If order_by (a list of columns)
+        is given, rows are stored sorted on it so DuckDB's zone maps can skip row groups.
         """
         partition_path = Path(base_path)
         if not partition_path.exists():
@@ -150,6 +154,8 @@ class DuckDBWrapper:
             CREATE OR REPLACE TABLE {table_name} AS 
             SELECT * FROM read_parquet('{path_str}', hive_partitioning=true, union_by_name=true)
             """
+            if order_by:
+                query += f"ORDER BY {', '.join(order_by)}"
             self.con.execute(query)
             self.registered_tables.append(table_name)
             print(f"Partitioned table '{table_name}' created for files at '{path_str}'.")
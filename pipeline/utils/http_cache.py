@@ -0,0 +1,211 @@
+# pipeline/utils/http_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+import requests
+
+
+class HttpResponseCache:
+    """
+    A small on-disk cache for GET responses, shared by SocrataResource and the
+    Open-Meteo clients so that reruns and retries don't download the same
+    payloads again.
+
+    Entries are keyed by URL plus normalized (sorted) query params. Each entry is
+    a body file and a small JSON sidecar:
+        {cache_dir}/{key}.body
+        {cache_dir}/{key}.json   -> url, params, ETag, Last-Modified, stored_at, size
+
+    Lookup rules:
+      - Younger than ttl_seconds: served from disk without a request.
+      - Older, with an ETag or Last-Modified: revalidated with a conditional GET,
+        and a 304 serves the cached body.
+      - Older, without validators: fetched again.
+      - With serve_stale_on_error=True, a request that fails with a connection
+        error or timeout serves the stale cached copy (with a warning), so offline
+        iteration keeps working. It is off by default: in a production pull it
+        would quietly mix old pages with fresh ones.
+
+    The cache is capped at max_bytes. The least recently used entries (by body
+    file mtime, which is touched on every hit) are evicted first.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int = 2 * 1024 ** 3,
+        ttl_seconds: float = 3600,
+        logger: logging.Logger = None,
+        serve_stale_on_error: bool = False,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.serve_stale_on_error = serve_stale_on_error
+        self.logger = logger or logging.getLogger(self.__class__.__name__)
+
+        self._lock = threading.Lock()
+        self._total_bytes: Optional[int] = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def fetch(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        session: Optional[requests.Session] = None,
+        timeout: Any = None,
+        before_request: Optional[Callable[[], None]] = None,
+    ) -> bytes:
+        """
+        GET `url` with `params` through the cache and return the response body.
+        Raises requests.HTTPError for non-2xx responses, which are never cached.
+        `before_request` is called right before each request that actually goes
+        over the network (e.g. a rate limiter), and never for fresh cache hits.
+        """
+        wait = before_request or (lambda: None)
+        http = session or requests
+        key = self.cache_key(url, params)
+        meta = self._read_meta(key)
+
+        if meta is not None and time.time() - meta["stored_at"] < self.ttl_seconds:
+            body = self._read_body(key)
+            if body is not None:
+                self.logger.debug(f"HTTP cache hit (fresh): {url}")
+                return body
+
+        headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        try:
+            wait()
+            resp = http.get(url, params=params, headers=headers, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            body = self._read_body(key) if self.serve_stale_on_error and meta is not None else None
+            if body is None:
+                raise
+            self.logger.warning(f"Request failed ({e}); serving stale cached copy of {url}")
+            return body
+
+        if resp.status_code == 304 and meta is not None:
+            body = self._read_body(key)
+            if body is not None:
+                self.logger.debug(f"HTTP cache hit (revalidated): {url}")
+                meta["stored_at"] = time.time()
+                self._write_meta(key, meta)
+                return body
+            # The body went missing under us, so fetch it unconditionally
+            wait()
+            resp = http.get(url, params=params, timeout=timeout)
+
+        resp.raise_for_status()
+        self._store(key, url, params, resp)
+        return resp.content
+
+    @staticmethod
+    def cache_key(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+        normalized = urlencode(sorted((str(k), str(v)) for k, v in (params or {}).items()))
+        return hashlib.sha256(f"{url}?{normalized}".encode("utf-8")).hexdigest()
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        base = os.path.join(self.cache_dir, key)
+        return f"{base}.body", f"{base}.json"
+
+    def _read_meta(self, key: str) -> Optional[Dict[str, Any]]:
+        _, meta_path = self._paths(key)
+        try:
+            with open(meta_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, key: str, meta: Dict[str, Any]) -> None:
+        _, meta_path = self._paths(key)
+        self._atomic_write(meta_path, json.dumps(meta).encode("utf-8"))
+
+    def _read_body(self, key: str) -> Optional[bytes]:
+        body_path, _ = self._paths(key)
+        try:
+            with open(body_path, "rb") as f:
+                body = f.read()
+            os.utime(body_path)  # Mark as recently used for LRU eviction
+            return body
+        except OSError:
+            return None
+
+    def _store(self, key: str, url: str, params: Optional[Dict[str, Any]], resp: requests.Response) -> None:
+        body = resp.content
+        if len(body) > self.max_bytes:
+            return
+
+        body_path, _ = self._paths(key)
+        old_size = os.path.getsize(body_path) if os.path.exists(body_path) else 0
+        self._atomic_write(body_path, body)
+        self._write_meta(
+            key,
+            {
+                "url": url,
+                "params": {str(k): str(v) for k, v in (params or {}).items()},
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "stored_at": time.time(),
+                "size": len(body),
+            },
+        )
+
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_total_bytes()
+            else:
+                self._total_bytes += len(body) - old_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _scan_total_bytes(self) -> int:
+        return sum(
+            entry.stat().st_size
+            for entry in os.scandir(self.cache_dir)
+            if entry.name.endswith(".body")
+        )
+
+    def _evict(self) -> None:
+        """
+        Drop least recently used entries until the cache is back under max_bytes.
+        Caller holds self._lock.
+        """
+        bodies = sorted(
+            (entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".body")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        total = sum(entry.stat().st_size for entry in bodies)
+        for entry in bodies:
+            if total <= self.max_bytes:
+                break
+            size = entry.stat().st_size
+            body_path, meta_path = self._paths(entry.name[: -len(".body")])
+            for path in (meta_path, body_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+            self.logger.debug(f"HTTP cache evicted {entry.name} ({size} bytes)")
+        self._total_bytes = total
+
+    def _atomic_write(self, path: str, data: bytes) -> None:
+        # Unique temp names keep concurrent writers of the same key from clobbering each other
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
@@ -0,0 +1,43 @@
+# pipeline/utils/incremental.py
+
+import os
+from typing import Any, List, Optional
+
+import polars as pl
+
+
+def read_high_water_mark(file_path: str, column: str) -> Optional[Any]:
+    """
+    Return the max value of `column` in an existing parquet file, or None if the
+    file doesn't exist yet. Only that one column is scanned, not the whole file.
+    """
+    if not os.path.exists(file_path):
+        return None
+    return pl.scan_parquet(file_path).select(pl.col(column).max()).collect().item()
+
+
+
+def append_merge(
+    file_path: str, new_df: pl.DataFrame, column: str, columns: Optional[List[str]] = None
+) -> pl.DataFrame:
+    """
+    Combine an existing parquet file with freshly fetched rows: existing rows
+    before the first `column` value in `new_df` are kept, and `new_df` replaces
+    everything from there on (so a re-fetched overlap window overwrites the old
+    copy instead of duplicating it). If nothing new was fetched, the existing
+    rows come back unchanged.
+
+    `columns` optionally limits which stored columns are read. The stored file
+    may have compacted dtypes or lack newly added columns, so the frames are
+    concatenated with relaxed (supertype) casting, and missing columns are null.
+    """
+    if not os.path.exists(file_path):
+        return new_df
+    existing = pl.scan_parquet(file_path)
+    if columns is not None:
+        existing = existing.select(columns)
+    if new_df.is_empty():
+        return existing.collect()
+
+    kept = existing.filter(pl.col(column) < new_df.get_column(column).min()).collect()
+    return pl.concat([kept, new_df], how="diagonal_relaxed").sort(column)
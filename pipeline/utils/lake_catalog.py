@@ -0,0 +1,308 @@
+# pipeline/utils/lake_catalog.py
+
+import datetime
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+import pyarrow.parquet as pq
+
+
+CATALOG_FILE = "_catalog.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS lake_files (
+    path TEXT PRIMARY KEY,        -- Relative to the lake root
+    asset TEXT NOT NULL,
+    partition_values TEXT,        -- JSON, e.g. {"year": "2024", "month": "01"}
+    bytes INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    row_count INTEGER NOT NULL,
+    row_groups INTEGER NOT NULL,
+    schema_hash TEXT NOT NULL,
+    schema_json TEXT NOT NULL,    -- [[column, arrow type], ...]
+    recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lake_files_asset ON lake_files (asset);
+CREATE TABLE IF NOT EXISTS lake_column_stats (
+    path TEXT NOT NULL,
+    column_name TEXT NOT NULL,
+    min_value,                    -- Untyped, so numbers stay numbers; dates and timestamps are ISO strings
+    max_value,
+    null_count INTEGER,
+    PRIMARY KEY (path, column_name)
+);
+CREATE TABLE IF NOT EXISTS lake_assets (
+    asset TEXT PRIMARY KEY,       -- Assets whose every file is in lake_files
+    synced_at REAL NOT NULL
+);
+"""
+
+
+def lake_catalog_path(lake_path: str) -> str:
+    return os.path.join(lake_path, CATALOG_FILE)
+
+
+class LakeCatalog:
+    """
+    One SQLite manifest of every parquet file in the lake, kept up to date by the
+    IO managers on each write. For each file it stores the asset, hive partition
+    values, byte size, row count, schema hash and per-column min/max/null counts,
+    all taken from the parquet footer, so recording a file never reads its data.
+
+    Consumers can then answer "how many rows", "what schema" and "which files can
+    hold rows between X and Y" from the catalog, without opening the data files:
+
+        catalog = LakeCatalog(LAKE_PATH)
+        catalog.row_count("mta_subway_hourly_ridership")
+        catalog.files("mta_subway_hourly_ridership", partition_values={"year": "2024"})
+        catalog.prune("mta_subway_hourly_ridership", "transit_timestamp", "2024-06-01", "2024-06-30")
+
+    An asset's entries are only complete once sync_asset() has walked its whole
+    directory; is_synced() tells consumers whether they can plan from the catalog
+    or still have to list the files themselves.
+    """
+
+    def __init__(self, lake_path: str, catalog_path: Optional[str] = None):
+        self.lake_path = os.path.abspath(lake_path)
+        self.catalog_path = catalog_path or lake_catalog_path(self.lake_path)
+        os.makedirs(os.path.dirname(self.catalog_path), exist_ok=True)
+        with self._connect() as con:
+            con.executescript(_SCHEMA)
+
+    def record_file(self, asset: str, file_path: str) -> bool:
+        """
+        Add or refresh one file. Files whose size and mtime match the catalog are
+        skipped without opening them. Returns True if the entry was (re)written.
+        """
+        rel_path = self._relative(file_path)
+        stat = os.stat(file_path)
+        with self._connect() as con:
+            row = con.execute("SELECT bytes, mtime FROM lake_files WHERE path = ?", (rel_path,)).fetchone()
+            if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime:
+                return False
+
+            entry, stats = self._describe(asset, file_path, rel_path, stat)
+            con.execute("DELETE FROM lake_column_stats WHERE path = ?", (rel_path,))
+            con.execute(
+                "INSERT OR REPLACE INTO lake_files VALUES "
+                "(:path, :asset, :partition_values, :bytes, :mtime, :row_count, :row_groups, "
+                ":schema_hash, :schema_json, :recorded_at)",
+                entry,
+            )
+            con.executemany("INSERT INTO lake_column_stats VALUES (?, ?, ?, ?, ?)", stats)
+        return True
+
+    def sync_directory(self, asset: str, directory: str, pattern: str = "*.parquet") -> int:
+        """
+        Make the catalog match the parquet files directly in `directory`: record new
+        or changed files and drop entries for files that are gone. Returns the
+        number of entries (re)written.
+        """
+        paths = sorted(glob.glob(os.path.join(directory, pattern)))
+        changed = sum(self.record_file(asset, path) for path in paths)
+
+        prefix = self._relative(directory).rstrip("/") + "/"
+        keep = {self._relative(path) for path in paths}
+        with self._connect() as con:
+            stale = [
+                path for (path,) in con.execute(
+                    "SELECT path FROM lake_files WHERE asset = ? AND substr(path, 1, ?) = ?",
+                    (asset, len(prefix), prefix),
+                )
+                # Only files directly in this directory, not in nested partitions
+                if path not in keep and "/" not in path[len(prefix):]
+            ]
+            self._delete(con, stale)
+        return changed
+
+    def sync_asset(self, asset: str, directory: str, pattern: str = "*.parquet") -> int:
+        """
+        Make the catalog match every file of an asset: record new or changed files
+        matching `pattern` under `directory` (e.g. "year=*/month=*/*.parquet"),
+        drop entries for files that are gone, and mark the asset as synced.
+        Returns the number of entries (re)written.
+        """
+        paths = sorted(glob.glob(os.path.join(directory, pattern)))
+        changed = sum(self.record_file(asset, path) for path in paths)
+
+        keep = {self._relative(path) for path in paths}
+        with self._connect() as con:
+            stale = [
+                path for (path,) in con.execute("SELECT path FROM lake_files WHERE asset = ?", (asset,))
+                if path not in keep
+            ]
+            self._delete(con, stale)
+            con.execute("INSERT OR REPLACE INTO lake_assets VALUES (?, ?)", (asset, time.time()))
+        return changed
+
+    def is_synced(self, asset: str) -> bool:
+        """
+        Whether the catalog lists every file of the asset, i.e. sync_asset() has run for it.
+        """
+        with self._connect() as con:
+            row = con.execute("SELECT 1 FROM lake_assets WHERE asset = ?", (asset,)).fetchone()
+        return row is not None
+
+    def remove_asset(self, asset: str) -> None:
+        with self._connect() as con:
+            paths = [path for (path,) in con.execute("SELECT path FROM lake_files WHERE asset = ?", (asset,))]
+            self._delete(con, paths)
+            con.execute("DELETE FROM lake_assets WHERE asset = ?", (asset,))
+
+    def files(self, asset: str, partition_values: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Catalog entries for an asset, optionally only those whose partition values
+        match every key in `partition_values`. Paths come back absolute.
+        """
+        with self._connect() as con:
+            con.row_factory = sqlite3.Row
+            rows = con.execute("SELECT * FROM lake_files WHERE asset = ? ORDER BY path", (asset,)).fetchall()
+
+        entries = []
+        for row in rows:
+            entry = dict(row)
+            entry["partition_values"] = json.loads(entry["partition_values"])
+            entry["path"] = os.path.join(self.lake_path, entry["path"])
+            if partition_values and any(
+                str(entry["partition_values"].get(key)) != str(value) for key, value in partition_values.items()
+            ):
+                continue
+            entries.append(entry)
+        return entries
+
+    def row_count(self, asset: str) -> int:
+        with self._connect() as con:
+            (rows,) = con.execute("SELECT COALESCE(SUM(row_count), 0) FROM lake_files WHERE asset = ?", (asset,)).fetchone()
+        return rows
+
+    def schemas(self, asset: str) -> Dict[str, List[List[str]]]:
+        """
+        The distinct schemas of an asset's files, keyed by schema hash. More than
+        one entry means the files have drifted.
+        """
+        with self._connect() as con:
+            rows = con.execute(
+                "SELECT DISTINCT schema_hash, schema_json FROM lake_files WHERE asset = ?", (asset,)
+            ).fetchall()
+        return {schema_hash: json.loads(schema_json) for schema_hash, schema_json in rows}
+
+    def prune(self, asset: str, column: str, low: Any = None, high: Any = None) -> List[str]:
+        """
+        Absolute paths of the asset's files that may hold `column` values in
+        [low, high]. Files without statistics for the column are always kept.
+        Dates and timestamps compare as ISO strings.
+        """
+        low, high = _sqlite_value(low), _sqlite_value(high)
+        with self._connect() as con:
+            rows = con.execute(
+                """
+                SELECT f.path FROM lake_files f
+                LEFT JOIN lake_column_stats s ON s.path = f.path AND s.column_name = ?
+                WHERE f.asset = ?
+                  AND (s.min_value IS NULL OR ? IS NULL OR s.max_value >= ?)
+                  AND (s.max_value IS NULL OR ? IS NULL OR s.min_value <= ?)
+                ORDER BY f.path
+                """,
+                (column, asset, low, low, high, high),
+            ).fetchall()
+        return [os.path.join(self.lake_path, path) for (path,) in rows]
+
+    def _describe(self, asset: str, file_path: str, rel_path: str, stat: os.stat_result):
+        metadata = pq.read_metadata(file_path)
+        arrow_schema = metadata.schema.to_arrow_schema()
+        schema = [[field.name, str(field.type)] for field in arrow_schema]
+        schema_json = json.dumps(schema)
+
+        entry = {
+            "path": rel_path,
+            "asset": asset,
+            "partition_values": json.dumps(_hive_partition_values(rel_path)),
+            "bytes": stat.st_size,
+            "mtime": stat.st_mtime,
+            "row_count": metadata.num_rows,
+            "row_groups": metadata.num_row_groups,
+            "schema_hash": hashlib.sha256(schema_json.encode("utf-8")).hexdigest(),
+            "schema_json": schema_json,
+            "recorded_at": time.time(),
+        }
+
+        # Fold row-group statistics into one min/max/null count per top-level column
+        column_stats = {}
+        for rg in range(metadata.num_row_groups):
+            row_group = metadata.row_group(rg)
+            for col in range(row_group.num_columns):
+                chunk = row_group.column(col)
+                name = chunk.path_in_schema
+                stats = chunk.statistics
+                current = column_stats.setdefault(name, {"min": None, "max": None, "nulls": 0, "complete": True})
+                if stats is None or not stats.has_min_max:
+                    current["complete"] = False
+                    continue
+                low, high = _sqlite_value(stats.min), _sqlite_value(stats.max)
+                try:
+                    current["min"] = low if current["min"] is None else min(current["min"], low)
+                    current["max"] = high if current["max"] is None else max(current["max"], high)
+                except TypeError:
+                    current["complete"] = False
+                if stats.has_null_count:
+                    current["nulls"] += stats.null_count
+
+        rows = []
+        for name, current in column_stats.items():
+            if "." in name:
+                continue  # Nested leaf columns
+            complete = current["complete"]
+            rows.append(
+                (
+                    rel_path,
+                    name,
+                    current["min"] if complete else None,
+                    current["max"] if complete else None,
+                    current["nulls"],
+                )
+            )
+        return entry, rows
+
+    def _delete(self, con: sqlite3.Connection, paths: Iterable[str]) -> None:
+        paths = [(path,) for path in paths]
+        con.executemany("DELETE FROM lake_column_stats WHERE path = ?", paths)
+        con.executemany("DELETE FROM lake_files WHERE path = ?", paths)
+
+    def _relative(self, path: str) -> str:
+        return os.path.relpath(os.path.abspath(path), self.lake_path).replace(os.sep, "/")
+
+    @contextmanager
+    def _connect(self):
+        # Writers in other threads or runs wait up to 30s for the lock instead of failing
+        con = sqlite3.connect(self.catalog_path, timeout=30)
+        try:
+            con.execute("PRAGMA journal_mode=WAL")
+            yield con
+            con.commit()
+        finally:
+            con.close()
+
+
+def _hive_partition_values(rel_path: str) -> Dict[str, str]:
+    values = {}
+    for part in rel_path.split("/")[:-1]:
+        if "=" in part:
+            key, value = part.split("=", 1)
+            values[key] = value
+    return values
+
+
+def _sqlite_value(value: Any) -> Any:
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    if isinstance(value, (bool, int, float, str)) or value is None:
+        return value
+    return str(value)
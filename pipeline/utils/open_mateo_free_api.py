@@ -1,10 +1,18 @@
+import io
+import json
 import logging
 import math
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
 
 import requests
 import polars as pl
+from requests.adapters import HTTPAdapter
+
+from pipeline.utils.http_cache import HttpResponseCache
 
 
 ##############################################################################
@@ -17,6 +25,9 @@ class OpenMeteoBaseClient:
       - Timeout
       - Retries (exponential backoff)
       - Detailed logging
+      - Optional on-disk response cache, shared with SocrataResource
+      - A pooled session, and chunked date ranges fetched in parallel under a rate limit
+      - Optional list of locations, fetched in batched multi-location requests
     """
     def __init__(
         self,
@@ -26,6 +37,12 @@ class OpenMeteoBaseClient:
         connect_timeout: float = 10.0,
         read_timeout: float = 30.0,
         logger: logging.Logger = None,
+        cache: HttpResponseCache = None,
+        max_workers: int = 4,
+        max_requests_per_second: float = 5.0,
+        max_values_per_request: int = 50_000,
+        locations: Optional[List[Tuple[str, float, float]]] = None,
+        max_locations_per_request: int = 20,
     ):
         """
         :param base_url: The API endpoint for Open-Meteo.
@@ -34,26 +51,67 @@ class OpenMeteoBaseClient:
         :param connect_timeout: Connection timeout (seconds).
         :param read_timeout: Read timeout (seconds).
         :param logger: Optional logger; if None, uses a default logger.
+        :param cache: Optional HttpResponseCache; if None, every request goes to the API.
+        :param max_workers: Date chunks fetched in parallel in chunked mode.
+        :param max_requests_per_second: Cap on request starts across all workers (None for no cap).
+        :param max_values_per_request: Target size of one chunk, in values (days or hours x variables x locations).
+        :param locations: Optional [(location_id, latitude, longitude), ...]. When set, the config's
+            single point is ignored, and results come back in long format with a `location` column.
+        :param max_locations_per_request: Locations sent together in one comma-separated request.
         """
         self.base_url = base_url
         self.max_retries = max_retries
         self.backoff_factor = backoff_factor
         self.connect_timeout = connect_timeout
         self.read_timeout = read_timeout
+        self.cache = cache
+        self.max_workers = max_workers
+        self.max_requests_per_second = max_requests_per_second
+        self.max_values_per_request = max_values_per_request
+        self.locations = list(locations) if locations else None
+        self.max_locations_per_request = max_locations_per_request
 
         # Provide a default logger if none supplied
         self.logger = logger or logging.getLogger(self.__class__.__name__)
 
+        # One pooled session, so parallel chunks reuse connections instead of opening one each
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._rate_lock = threading.Lock()
+        self._next_request_at = time.monotonic()
+
     def _request(self, params: dict) -> dict:
         """
         Makes a GET request to self.base_url with the given params, retrying on failure.
         Returns JSON if successful, otherwise raises an exception.
         """
+        return json.loads(self._request_body(params))
+
+    def _request_body(self, params: dict) -> bytes:
+        """
+        Same as _request, but returns the raw response body, for callers that hand
+        it straight to a columnar decoder.
+        """
         attempt = 1
         while True:
             try:
                 self.logger.debug(f"Attempt {attempt}: GET {self.base_url} with {params}")
-                response = requests.get(
+                if self.cache is not None:
+                    # Only requests that reach the network count against the rate limit
+                    body = self.cache.fetch(
+                        self.base_url,
+                        params,
+                        session=self.session,
+                        timeout=(self.connect_timeout, self.read_timeout),
+                        before_request=self._wait_for_rate_limit,
+                    )
+                    return body
+
+                self._wait_for_rate_limit()
+                response = self.session.get(
                     self.base_url,
                     params=params,
                     timeout=(self.connect_timeout, self.read_timeout)
@@ -61,7 +119,7 @@ class OpenMeteoBaseClient:
 
                 if response.status_code == 200:
                     self.logger.debug("Request succeeded.")
-                    return response.json()
+                    return response.content
 
                 # Non-200 => raise with status info
                 raise requests.HTTPError(
@@ -87,10 +145,157 @@ class OpenMeteoBaseClient:
                 attempt += 1
 
 
+    def _frame_from_body(
+        self,
+        body: bytes,
+        section: str,
+        variables: dict,
+        time_format: str,
+        location_ids: Optional[List[str]] = None,
+    ) -> pl.DataFrame:
+        """
+        Decode an Open-Meteo response into a DataFrame without building Python
+        lists. The body is parsed by Polars' native JSON reader, so the
+        `section` ("daily" or "hourly") arrives as one row of list columns. They
+        are exploded together, `time` is parsed into a `date` column with
+        str.to_datetime, and `variables` maps each API variable to its output
+        column name.
+
+        A multi-location request returns a JSON array with one object per
+        location, in request order. Each becomes one row before exploding, and
+        `location_ids` labels them in a leading `location` column.
+        """
+        payload = pl.read_json(io.BytesIO(body))
+        if section not in payload.columns:
+            self.logger.warning(f"No '{section}' data found in response.")
+            return pl.DataFrame()
+
+        values = payload.select(pl.col(section)).with_row_index("location_index").unnest(section)
+        if "time" not in values.columns:
+            self.logger.warning(f"No '{section}' data found in response.")
+            return pl.DataFrame()
+
+        missing = [name for name in variables if name not in values.columns]
+        if missing:
+            raise ValueError(f"Open-Meteo response is missing {section} variables {missing}")
+
+        columns = [
+            pl.col("time").str.to_datetime(time_format).alias("date"),
+            *[pl.col(name).alias(column) for name, column in variables.items()],
+        ]
+        if location_ids is not None:
+            if values.height != len(location_ids):
+                raise ValueError(
+                    f"Open-Meteo returned {values.height} locations, expected {len(location_ids)}"
+                )
+            columns.insert(
+                0,
+                pl.col("location_index")
+                .replace_strict(list(range(len(location_ids))), location_ids, return_dtype=pl.Utf8)
+                .alias("location"),
+            )
+
+        lists = [name for name in values.columns if name != "location_index"]
+        return values.explode(lists).select(columns)
+
+    def _wait_for_rate_limit(self) -> None:
+        """
+        Space request starts at least 1 / max_requests_per_second apart, across threads.
+        """
+        if not self.max_requests_per_second:
+            return
+        with self._rate_lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_request_at)
+            self._next_request_at = start_at + 1.0 / self.max_requests_per_second
+        if start_at > now:
+            time.sleep(start_at - now)
+
+    def _chunk_days(self, num_vars: int, values_per_day: int) -> int:
+        """
+        Days per chunk, so that each request carries about max_values_per_request
+        values: a few variables (or locations) can go in long windows, many in
+        short ones.
+        """
+        locations = min(len(self.locations), self.max_locations_per_request) if self.locations else 1
+        return max(1, self.max_values_per_request // max(1, num_vars * values_per_day * locations))
+
+    def _location_batches(self) -> list:
+        """
+        Locations grouped for multi-location requests, or [None] for the config's single point.
+        """
+        if not self.locations:
+            return [None]
+        size = self.max_locations_per_request
+        return [self.locations[i:i + size] for i in range(0, len(self.locations), size)]
+
+    @staticmethod
+    def _location_params(locations, latitude: float, longitude: float) -> dict:
+        if not locations:
+            return {"latitude": latitude, "longitude": longitude}
+        return {
+            "latitude": ",".join(str(lat) for _, lat, _ in locations),
+            "longitude": ",".join(str(lon) for _, _, lon in locations),
+        }
+
+    def _fetch_in_chunks(self, start_date: str, end_date: str, chunk_days: Optional[int], fetch_range) -> pl.DataFrame:
+        """
+        Split [start_date, end_date] into windows of `chunk_days` (one window if
+        None), cross them with the location batches, fetch every piece in
+        parallel with `fetch_range(chunk_start, chunk_end, locations)`, and
+        reassemble the frames in (location, date) order.
+        """
+        start_dt = datetime.strptime(start_date, "%Y-%m-%d")
+        end_dt = datetime.strptime(end_date, "%Y-%m-%d")
+        if chunk_days is None:
+            chunk_days = (end_dt - start_dt).days + 1
+
+        windows = []
+        current_start = start_dt
+        while current_start <= end_dt:
+            current_end = min(current_start + timedelta(days=chunk_days - 1), end_dt)
+            windows.append((current_start.strftime("%Y-%m-%d"), current_end.strftime("%Y-%m-%d")))
+            current_start = current_end + timedelta(days=1)
+
+        tasks = [(start, end, batch) for batch in self._location_batches() for (start, end) in windows]
+        self.logger.info(
+            f"Fetching {start_date} to {end_date} in {len(tasks)} requests "
+            f"({len(windows)} chunks of up to {chunk_days} days x {len(tasks) // len(windows)} location batches) "
+            f"with {self.max_workers} workers."
+        )
+        # map() yields results in submission order, i.e. date order within each location batch
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            frames = list(executor.map(lambda task: fetch_range(*task), tasks))
+
+        frames = [df for df in frames if df is not None and df.shape[0] > 0]
+        if not frames:
+            # Return an empty DataFrame
+            return pl.DataFrame()
+        df = pl.concat(frames, how="vertical")
+        return df.sort(["location", "date"]) if self.locations else df
+
 ##############################################################################
 # Daily Client
 ##############################################################################
 
+# API variable -> output column
+DAILY_VARS = {
+    "weathercode": "weather_code",
+    "temperature_2m_max": "temperature_max",
+    "temperature_2m_min": "temperature_min",
+    "temperature_2m_mean": "temperature_mean",
+    "apparent_temperature_max": "apparent_temperature_max",
+    "apparent_temperature_min": "apparent_temperature_min",
+    "apparent_temperature_mean": "apparent_temperature_mean",
+    "sunrise": "sunrise",
+    "sunset": "sunset",
+    "precipitation_sum": "precipitation_sum",
+    "rain_sum": "rain_sum",
+    "snowfall_sum": "snowfall_sum",
+    "precipitation_hours": "precipitation_hours",
+}
+
+
 class OpenMateoDailyWeatherConfig:
     def __init__(
         self,
@@ -118,6 +323,13 @@ class OpenMateoDailyWeatherClient(OpenMeteoBaseClient):
         connect_timeout=10.0,
         read_timeout=30.0,
         logger=None,
+        cache=None,
+        max_workers=4,
+        max_requests_per_second=5.0,
+        max_values_per_request=50_000,
+        locations=None,
+        max_locations_per_request=20,
+        daily_vars=None,
     ):
         super().__init__(
             max_retries=max_retries,
@@ -125,40 +337,33 @@ class OpenMateoDailyWeatherClient(OpenMeteoBaseClient):
             connect_timeout=connect_timeout,
             read_timeout=read_timeout,
             logger=logger,
+            cache=cache,
+            max_workers=max_workers,
+            max_requests_per_second=max_requests_per_second,
+            max_values_per_request=max_values_per_request,
+            locations=locations,
+            max_locations_per_request=max_locations_per_request,
         )
         self.config = config
-        self.daily_vars = [
-            "weathercode",
-            "temperature_2m_max",
-            "temperature_2m_min",
-            "temperature_2m_mean",
-            "apparent_temperature_max",
-            "apparent_temperature_min",
-            "apparent_temperature_mean",
-            "sunrise",
-            "sunset",
-            "precipitation_sum",
-            "rain_sum",
-            "snowfall_sum",
-            "precipitation_hours",
-        ]
+        self.daily_vars = daily_vars or DAILY_VARS
 
-    def fetch_daily_data(self, chunked: bool = False) -> pl.DataFrame:
+    def fetch_daily_data(self, chunked: bool = True) -> pl.DataFrame:
         """
-        Fetches daily data. If chunked=True, fetch it in smaller date chunks
-        to avoid potential timeouts for large date ranges.
+        Fetches daily data. By default the range is split into chunks sized to the
+        number of variables and fetched in parallel, which avoids timeouts on long
+        ranges. chunked=False sends the whole range as one request (per location batch).
         """
-        if not chunked:
-            return self._fetch_single_range(self.config.start_date, self.config.end_date)
-
-        # Otherwise, do chunking
-        self.logger.info("Fetching daily data in smaller chunks to avoid timeouts.")
-        return self._fetch_in_chunks()
+        chunk_days = self._chunk_days(len(self.daily_vars), values_per_day=1) if chunked else None
+        return self._fetch_in_chunks(
+            self.config.start_date,
+            self.config.end_date,
+            chunk_days,
+            self._fetch_single_range,
+        )
 
-    def _fetch_single_range(self, start_date: str, end_date: str) -> pl.DataFrame:
+    def _fetch_single_range(self, start_date: str, end_date: str, locations=None) -> pl.DataFrame:
         params = {
-            "latitude": self.config.latitude,
-            "longitude": self.config.longitude,
+            **self._location_params(locations, self.config.latitude, self.config.longitude),
             "start_date": start_date,
             "end_date": end_date,
             "daily": ",".join(self.daily_vars),
@@ -166,65 +371,12 @@ class OpenMateoDailyWeatherClient(OpenMeteoBaseClient):
             "temperature_unit": self.config.temperature_unit,
         }
 
-        data = self._request(params)
-        return self._process_response(data)
-
-    def _fetch_in_chunks(self) -> pl.DataFrame:
-        """
-        Fetch data chunked by (for example) 30 days at a time.
-        Adjust chunk size as needed.
-        """
-        chunk_size = 30
-        start_dt = datetime.strptime(self.config.start_date, "%Y-%m-%d")
-        end_dt = datetime.strptime(self.config.end_date, "%Y-%m-%d")
-
-        all_frames = []
-        current_start = start_dt
-
-        while current_start <= end_dt:
-            current_end = current_start + timedelta(days=chunk_size - 1)
-            if current_end > end_dt:
-                current_end = end_dt
-
-            chunk_start_str = current_start.strftime("%Y-%m-%d")
-            chunk_end_str = current_end.strftime("%Y-%m-%d")
-            self.logger.info(f"Fetching daily data from {chunk_start_str} to {chunk_end_str}")
-            df = self._fetch_single_range(chunk_start_str, chunk_end_str)
-            if df is not None and df.shape[0] > 0:
-                all_frames.append(df)
-
-            current_start = current_end + timedelta(days=1)
-
-        if all_frames:
-            return pl.concat(all_frames, how="vertical")
-        else:
-            # Return an empty DataFrame
-            return pl.DataFrame()
-
-    def _process_response(self, data: dict) -> pl.DataFrame:
-        # Check if 'daily' in data, else return empty or raise an error
-        if 'daily' not in data or 'time' not in data['daily']:
-            self.logger.warning(f"No 'daily' data found in response.")
-            return pl.DataFrame()
+        body = self._request_body(params)
+        return self._process_response(body, locations)
 
-        daily = data["daily"]
-        daily_data = {
-            "date": [datetime.strptime(d, "%Y-%m-%d") for d in daily["time"]],
-            "weather_code": daily["weathercode"],
-            "temperature_max": daily["temperature_2m_max"],
-            "temperature_min": daily["temperature_2m_min"],
-            "temperature_mean": daily["temperature_2m_mean"],
-            "apparent_temperature_max": daily["apparent_temperature_max"],
-            "apparent_temperature_min": daily["apparent_temperature_min"],
-            "apparent_temperature_mean": daily["apparent_temperature_mean"],
-            "sunrise": daily["sunrise"],
-            "sunset": daily["sunset"],
-            "precipitation_sum": daily["precipitation_sum"],
-            "rain_sum": daily["rain_sum"],
-            "snowfall_sum": daily["snowfall_sum"],
-            "precipitation_hours": daily["precipitation_hours"],
-        }
-        df = pl.DataFrame(daily_data)
+    def _process_response(self, body: bytes, locations=None) -> pl.DataFrame:
+        location_ids = [location_id for location_id, _, _ in locations] if locations else None
+        df = self._frame_from_body(body, "daily", self.daily_vars, "%Y-%m-%d", location_ids)
         self.logger.info(f"Fetched daily data: {df.shape[0]} rows.")
         return df
 
@@ -233,6 +385,17 @@ class OpenMateoDailyWeatherClient(OpenMeteoBaseClient):
 # Hourly Client
 ##############################################################################
 
+# API variable -> output column
+HOURLY_VARS = {
+    "temperature_2m": "temperature_2m",
+    "apparent_temperature": "apparent_temperature",
+    "precipitation": "precipitation",
+    "rain": "rain",
+    "snowfall": "snowfall",
+    "weathercode": "weather_code",
+}
+
+
 class OpenMateoHourlyWeatherConfig:
     def __init__(
         self,
@@ -260,6 +423,13 @@ class OpenMateoHourlyWeatherClient(OpenMeteoBaseClient):
         connect_timeout=10.0,
         read_timeout=30.0,
         logger=None,
+        cache=None,
+        max_workers=4,
+        max_requests_per_second=5.0,
+        max_values_per_request=50_000,
+        locations=None,
+        max_locations_per_request=20,
+        hourly_vars=None,
     ):
         super().__init__(
             max_retries=max_retries,
@@ -267,26 +437,31 @@ class OpenMateoHourlyWeatherClient(OpenMeteoBaseClient):
             connect_timeout=connect_timeout,
             read_timeout=read_timeout,
             logger=logger,
+            cache=cache,
+            max_workers=max_workers,
+            max_requests_per_second=max_requests_per_second,
+            max_values_per_request=max_values_per_request,
+            locations=locations,
+            max_locations_per_request=max_locations_per_request,
         )
         self.config = config
-        self.hourly_vars = [
-            "temperature_2m",
-            "precipitation",
-            "rain",
-            "weathercode",
-        ]
+        self.hourly_vars = hourly_vars or HOURLY_VARS
 
-    def fetch_hourly_data(self, chunked: bool = False) -> pl.DataFrame:
-        if not chunked:
-            return self._fetch_single_range(self.config.start_date, self.config.end_date)
-        else:
-            self.logger.info("Fetching hourly data in smaller chunks to avoid timeouts.")
-            return self._fetch_in_chunks()
+    def fetch_hourly_data(self, chunked: bool = True) -> pl.DataFrame:
+        """
+        Fetches hourly data, in parallel chunks by default (see fetch_daily_data).
+        """
+        chunk_days = self._chunk_days(len(self.hourly_vars), values_per_day=24) if chunked else None
+        return self._fetch_in_chunks(
+            self.config.start_date,
+            self.config.end_date,
+            chunk_days,
+            self._fetch_single_range,
+        )
 
-    def _fetch_single_range(self, start_date: str, end_date: str) -> pl.DataFrame:
+    def _fetch_single_range(self, start_date: str, end_date: str, locations=None) -> pl.DataFrame:
         params = {
-            "latitude": self.config.latitude,
-            "longitude": self.config.longitude,
+            **self._location_params(locations, self.config.latitude, self.config.longitude),
             "start_date": start_date,
             "end_date": end_date,
             "hourly": ",".join(self.hourly_vars),
@@ -294,53 +469,11 @@ class OpenMateoHourlyWeatherClient(OpenMeteoBaseClient):
             "temperature_unit": self.config.temperature_unit,
         }
 
-        data = self._request(params)
-        return self._process_response(data)
-
-    def _fetch_in_chunks(self) -> pl.DataFrame:
-        """
-        Fetch data chunked by 7 days at a time, for example.
-        Hourly data can be big, so chunk accordingly.
-        """
-        chunk_size = 7
-        start_dt = datetime.strptime(self.config.start_date, "%Y-%m-%d")
-        end_dt = datetime.strptime(self.config.end_date, "%Y-%m-%d")
-
-        all_frames = []
-        current_start = start_dt
-
-        while current_start <= end_dt:
-            current_end = current_start + timedelta(days=chunk_size - 1)
-            if current_end > end_dt:
-                current_end = end_dt
-
-            chunk_start_str = current_start.strftime("%Y-%m-%d")
-            chunk_end_str = current_end.strftime("%Y-%m-%d")
-            self.logger.info(f"Fetching hourly data from {chunk_start_str} to {chunk_end_str}")
-            df = self._fetch_single_range(chunk_start_str, chunk_end_str)
-            if df is not None and df.shape[0] > 0:
-                all_frames.append(df)
-
-            current_start = current_end + timedelta(days=1)
-
-        if all_frames:
-            return pl.concat(all_frames, how="vertical")
-        else:
-            return pl.DataFrame()
+        body = self._request_body(params)
+        return self._process_response(body, locations)
 
-    def _process_response(self, data: dict) -> pl.DataFrame:
-        if 'hourly' not in data or 'time' not in data['hourly']:
-            self.logger.warning(f"No 'hourly' data found in response.")
-            return pl.DataFrame()
-
-        hourly = data["hourly"]
-        hourly_data = {
-            "date": [datetime.strptime(dt, "%Y-%m-%dT%H:%M") for dt in hourly["time"]],
-            "temperature_2m": hourly["temperature_2m"],
-            "precipitation": hourly["precipitation"],
-            "rain": hourly["rain"],
-            "weather_code": hourly["weathercode"],
-        }
-        df = pl.DataFrame(hourly_data)
+    def _process_response(self, body: bytes, locations=None) -> pl.DataFrame:
+        location_ids = [location_id for location_id, _, _ in locations] if locations else None
+        df = self._frame_from_body(body, "hourly", self.hourly_vars, "%Y-%m-%dT%H:%M", location_ids)
         self.logger.info(f"Fetched hourly data: {df.shape[0]} rows.")
         return df
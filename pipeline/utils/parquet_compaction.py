@@ -0,0 +1,223 @@
+# pipeline/utils/parquet_compaction.py
+
+import ctypes
+import ctypes.util
+import errno
+import glob
+import json
+import math
+import os
+import shutil
+from typing import Any, Dict, List, Optional, Tuple
+
+import polars as pl
+
+
+COMPACTION_MARKER = "_compaction.json"
+RECORD_SUFFIX = ".meta.json"  # Download sidecar records, see FastOpenDataPartitionedParquetIOManager
+
+# renameat2() arguments, from <fcntl.h> and <linux/fs.h>
+_AT_FDCWD = -100
+_RENAME_EXCHANGE = 2
+
+
+def read_compaction_marker(partition_dir: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(partition_dir, COMPACTION_MARKER)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def compact_partition(
+    partition_dir: str,
+    file_prefix: str,
+    sort_by: List[str],
+    target_rows_per_file: int = 10_000_000,
+    row_group_size: int = 122_880,
+    compression_level: int = 3,
+) -> Optional[Dict[str, Any]]:
+    """
+    Rewrite every parquet file in one partition directory (e.g. .../year=2024/month=01)
+    into as few files as possible, sorted by `sort_by`, so readers open one file
+    instead of dozens and row-group min/max statistics can prune on the sort keys.
+
+    Files are written with zstd, full column statistics and `row_group_size` rows
+    per group (DuckDB's own row group size, so its zone maps line up). Output is
+    named {file_prefix}_compacted_{i}.parquet.
+
+    The new partition is built in a hidden sibling directory (.month=01.compacting)
+    and swapped in with a single renameat2(RENAME_EXCHANGE), so a
+    `year=*/month=*/*.parquet` reader sees either the old files or the new ones,
+    never both and never an empty month. Where the exchange isn't available
+    (non-Linux, or a filesystem without it) the swap falls back to two renames:
+    month=01 -> .month=01.old, then the staged directory -> month=01, during
+    which the month is briefly absent. If the process dies in that window,
+    recover_partition() (called here and by the downloader before touching a
+    month) restores or finishes the swap.
+
+    Download sidecar records of the merged files are carried over and flagged
+    "compacted", and a
+    _compaction.json marker lists what was merged, so the downloader can tell the
+    month is unchanged without the original files.
+
+    Returns the marker, or None if the partition is already compacted.
+    """
+    recover_partition(partition_dir)
+    marker = read_compaction_marker(partition_dir)
+    compacted_files = set(marker["files"]) if marker else set()
+    parquet_files = sorted(glob.glob(os.path.join(partition_dir, "*.parquet")))
+    new_files = [path for path in parquet_files if os.path.basename(path) not in compacted_files]
+    if not parquet_files or (marker and not new_files):
+        return None
+
+    # A merged file showing up again means its old rows are already in the compacted
+    # output; merging it would duplicate them. Drop the compaction instead, so the
+    # next download fetches the whole month again.
+    reappeared = [os.path.basename(path) for path in new_files if marker and os.path.basename(path) in marker["sources"]]
+    if reappeared:
+        drop_compaction(partition_dir)
+        raise RuntimeError(
+            f"{partition_dir}: {reappeared} were already merged by an earlier compaction. "
+            "The compaction was dropped; materialize the month again to re-download it."
+        )
+
+    stage_dir, old_dir = _swap_dirs(partition_dir)
+    shutil.rmtree(stage_dir, ignore_errors=True)
+    os.makedirs(stage_dir)
+
+    # diagonal_relaxed tolerates batches whose columns or dtypes drifted
+    df = pl.concat(
+        [pl.scan_parquet(path, hive_partitioning=False) for path in parquet_files],
+        how="diagonal_relaxed",
+    ).sort(sort_by).collect()
+
+    num_files = max(1, math.ceil(df.height / target_rows_per_file))
+    rows_per_file = math.ceil(df.height / num_files)
+    file_names = []
+    for i in range(num_files):
+        file_name = f"{file_prefix}_compacted_{i}.parquet"
+        df.slice(i * rows_per_file, rows_per_file).write_parquet(
+            os.path.join(stage_dir, file_name),
+            compression="zstd",
+            compression_level=compression_level,
+            statistics="full",
+            row_group_size=row_group_size,
+        )
+        file_names.append(file_name)
+
+    sources = list(marker["sources"]) if marker else []
+    for path in new_files:
+        sources.append(os.path.basename(path))
+        record_path = f"{path}{RECORD_SUFFIX}"
+        try:
+            with open(record_path) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            continue
+        record["compacted"] = True
+        with open(os.path.join(stage_dir, os.path.basename(record_path)), "w") as f:
+            json.dump(record, f)
+    # Records of files merged by an earlier compaction are already flagged
+    for record_path in glob.glob(os.path.join(partition_dir, f"*{RECORD_SUFFIX}")):
+        target = os.path.join(stage_dir, os.path.basename(record_path))
+        if not os.path.exists(target):
+            shutil.copy2(record_path, target)
+
+    marker = {
+        "files": file_names,
+        "sources": sources,
+        "sort_by": sort_by,
+        "row_count": df.height,
+        "bytes": sum(os.path.getsize(os.path.join(stage_dir, name)) for name in file_names),
+        "bytes_before": sum(os.path.getsize(path) for path in parquet_files),
+    }
+    with open(os.path.join(stage_dir, COMPACTION_MARKER), "w") as f:
+        json.dump(marker, f)
+
+    if _exchange_dirs(stage_dir, partition_dir):
+        # The staging directory now holds the old files
+        shutil.rmtree(stage_dir, ignore_errors=True)
+    else:
+        shutil.rmtree(old_dir, ignore_errors=True)
+        os.rename(partition_dir, old_dir)
+        os.rename(stage_dir, partition_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    return marker
+
+
+def recover_partition(partition_dir: str) -> None:
+    """
+    Clean up after a compaction that died mid-swap (only the two-rename fallback
+    has such a window). If the month is missing (or
+    only an empty directory) while .month=MM.old exists, the swap is finished when
+    the staged directory is complete (it holds the marker, which is written last),
+    and rolled back otherwise. A leftover .old next to an intact month is removed.
+    Half-built staging directories, and ones left holding the old files after
+    an exchange, are left to compact_partition, which clears them before it starts.
+    """
+    stage_dir, old_dir = _swap_dirs(partition_dir)
+    if not os.path.isdir(old_dir):
+        return
+    if not (os.path.isdir(partition_dir) and os.listdir(partition_dir)):
+        if os.path.isdir(partition_dir):
+            os.rmdir(partition_dir)
+        if os.path.exists(os.path.join(stage_dir, COMPACTION_MARKER)):
+            os.rename(stage_dir, partition_dir)
+        else:
+            os.rename(old_dir, partition_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def drop_compaction(partition_dir: str) -> None:
+    """
+    Undo a compaction's bookkeeping once an upstream file has changed: remove the
+    compacted files, the marker and the records of merged files, so the next
+    download fetches every batch of the month again.
+    """
+    marker = read_compaction_marker(partition_dir)
+    if marker is None:
+        return
+    for file_name in marker["files"]:
+        _remove(os.path.join(partition_dir, file_name))
+    for file_name in marker["sources"]:
+        if not os.path.exists(os.path.join(partition_dir, file_name)):
+            _remove(os.path.join(partition_dir, f"{file_name}{RECORD_SUFFIX}"))
+    _remove(os.path.join(partition_dir, COMPACTION_MARKER))
+
+
+def _exchange_dirs(a: str, b: str) -> bool:
+    """
+    Atomically swap two directories with renameat2(RENAME_EXCHANGE). Returns
+    False when the platform, libc or filesystem doesn't support it.
+    """
+    libc_name = ctypes.util.find_library("c")
+    if libc_name is None:
+        return False
+    libc = ctypes.CDLL(libc_name, use_errno=True)
+    renameat2 = getattr(libc, "renameat2", None)  # glibc 2.28+
+    if renameat2 is None:
+        return False
+    renameat2.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+    renameat2.restype = ctypes.c_int
+    if renameat2(_AT_FDCWD, os.fsencode(a), _AT_FDCWD, os.fsencode(b), _RENAME_EXCHANGE) == 0:
+        return True
+    error = ctypes.get_errno()
+    if error in (errno.EINVAL, errno.ENOSYS, errno.ENOTSUP):
+        return False
+    raise OSError(error, os.strerror(error), a, None, b)
+
+
+def _swap_dirs(partition_dir: str) -> Tuple[str, str]:
+    """
+    The hidden staging and rollback directories next to a partition.
+    """
+    parent, name = os.path.split(os.path.normpath(partition_dir))
+    return os.path.join(parent, f".{name}.compacting"), os.path.join(parent, f".{name}.old")
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
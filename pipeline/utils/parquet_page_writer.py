@@ -0,0 +1,220 @@
+# pipeline/utils/parquet_page_writer.py
+
+import hashlib
+import json
+import os
+import shutil
+from typing import Any, Dict, List, Optional, Union
+
+import polars as pl
+
+
+class ParquetPageWriter:
+    """
+    Spills pages of an asset to disk as they arrive, one parquet part file per
+    page, instead of holding every page in memory until the end.
+
+    An asset writes its processed pages here and returns the writer itself as its
+    output. SingleFilePolarsParquetIOManager then calls finalize(), which streams
+    the part files into the asset's single parquet file. Peak memory therefore
+    depends on page size, not on dataset size.
+
+    For example, with staging_dir ".../_staging/my_asset" we write:
+        .../_staging/my_asset/part-00000.parquet
+        .../_staging/my_asset/part-00001.parquet
+        ...
+        .../_staging/my_asset/checkpoint.json
+
+    When a `fingerprint` is given, the staging directory doubles as a checkpoint.
+    After every part, checkpoint.json records the parts written so far and the
+    pagination cursor of the last page. If a run fails, the next writer with
+    the same fingerprint picks up those parts and its `cursor` says where to
+    resume. Any other fingerprint (a different query) starts from scratch.
+
+    Parts written with write_lazy() are "carried over" rows from the stored file,
+    which may hold compacted dtypes (Int16, Categorical, ...). They never set the
+    shared schema: scan() casts them up to the schema of the freshly fetched
+    pages, so a new value that no longer fits a compacted dtype isn't truncated
+    or rejected, and dtypes are compacted again only at finalize().
+    """
+
+    CHECKPOINT_FILE = "checkpoint.json"
+
+    def __init__(self, staging_dir: str, fingerprint: Optional[str] = None):
+        self.staging_dir = staging_dir
+        self.fingerprint = fingerprint
+        self.part_paths: List[str] = []
+        self.carried_paths: List[str] = []  # Parts written by write_lazy, see above
+        self.row_count = 0
+        self.page_row_count = 0  # Rows that came in through write_page, i.e. freshly fetched
+        self.schema: Optional[pl.Schema] = None
+        self.cursor: Optional[Dict[str, Any]] = None
+        self.resumed = False
+
+        if fingerprint is not None and self._load_checkpoint():
+            self.resumed = True
+            return
+
+        # Leftovers from an earlier run of a different query are never valid for this one
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    def write_page(self, df: pl.DataFrame, cursor: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Write one in-memory page as the next part file. `cursor` is where
+        pagination continues after this page, and is checkpointed with it.
+        """
+        if cursor is not None:
+            self.cursor = cursor
+        if df.is_empty():
+            self._save_checkpoint()
+            return
+        path = self._next_part_path()
+        self._conform(df).write_parquet(path)
+        self.part_paths.append(path)
+        self.row_count += df.height
+        self.page_row_count += df.height
+        self._save_checkpoint()
+
+    def write_lazy(self, lf: pl.LazyFrame) -> None:
+        """
+        Stream a LazyFrame (e.g. rows carried over from an existing file) into the
+        next part file without collecting it. Its dtypes are kept as they are and
+        reconciled with the pages' schema in scan().
+        """
+        path = self._next_part_path()
+        lf.sink_parquet(path)
+
+        rows = pl.scan_parquet(path).select(pl.len()).collect().item()
+        if rows == 0:
+            os.remove(path)
+            return
+        self.part_paths.append(path)
+        self.carried_paths.append(path)
+        self.row_count += rows
+        self._save_checkpoint()
+
+    def scan(self) -> pl.LazyFrame:
+        """
+        Lazily scan every part written so far, in write order. Carried-over parts
+        are cast to the pages' schema, once a page has set one.
+        """
+        if not self.part_paths:
+            return pl.LazyFrame(schema=self.schema)
+        if self.schema is None or not self.carried_paths:
+            return pl.scan_parquet(self.part_paths)
+        frames = []
+        for path in self.part_paths:
+            lf = pl.scan_parquet(path)
+            if path in self.carried_paths:
+                names = lf.collect_schema().names()
+                lf = lf.with_columns(
+                    [pl.col(name).cast(dtype) for name, dtype in self.schema.items() if name in names]
+                )
+            frames.append(lf)
+        # Stored columns the pages no longer have are kept, null for the fresh rows
+        return pl.concat(frames, how="diagonal_relaxed")
+
+    def finalize(self, file_path: str, dtypes: Optional[Dict[str, pl.DataType]] = None) -> None:
+        """
+        Stream all parts into `file_path`, then remove the staging directory.
+        `dtypes` optionally casts columns on the way through. The file is written
+        under a temporary name and renamed into place, so readers never see a
+        half-written file.
+        """
+        tmp_path = f"{file_path}.tmp"
+        if self.part_paths:
+            self.scan().cast(dtypes or {}).sink_parquet(tmp_path)
+        else:
+            pl.DataFrame(schema=self.schema).write_parquet(tmp_path)
+        os.replace(tmp_path, file_path)
+        self.cleanup()
+
+    def staged_bytes(self) -> int:
+        """
+        Total size on disk of the part files written so far.
+        """
+        return sum(os.path.getsize(path) for path in self.part_paths)
+
+    def cleanup(self) -> None:
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    def _checkpoint_path(self) -> str:
+        return os.path.join(self.staging_dir, self.CHECKPOINT_FILE)
+
+    def _save_checkpoint(self) -> None:
+        if self.fingerprint is None:
+            return
+        state = {
+            "fingerprint": self.fingerprint,
+            "parts": [os.path.basename(path) for path in self.part_paths],
+            "carried": [os.path.basename(path) for path in self.carried_paths],
+            "row_count": self.row_count,
+            "page_row_count": self.page_row_count,
+            "cursor": self.cursor,
+        }
+        # Write then rename, so a crash mid-write never leaves a corrupt checkpoint
+        tmp_path = f"{self._checkpoint_path()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._checkpoint_path())
+
+    def _load_checkpoint(self) -> bool:
+        try:
+            with open(self._checkpoint_path()) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if state.get("fingerprint") != self.fingerprint:
+            return False
+
+        part_paths = [os.path.join(self.staging_dir, name) for name in state["parts"]]
+        if not all(os.path.exists(path) for path in part_paths):
+            return False
+
+        self.part_paths = part_paths
+        self.carried_paths = [os.path.join(self.staging_dir, name) for name in state.get("carried", [])]
+        self.row_count = state["row_count"]
+        self.page_row_count = state["page_row_count"]
+        self.cursor = state["cursor"]
+        page_paths = [path for path in part_paths if path not in self.carried_paths]
+        if page_paths:
+            self.schema = pl.Schema(pl.read_parquet_schema(page_paths[0]))
+        return True
+
+    def _next_part_path(self) -> str:
+        return os.path.join(self.staging_dir, f"part-{len(self.part_paths):05d}.parquet")
+
+    def _conform(self, frame: Union[pl.DataFrame, pl.LazyFrame]) -> Union[pl.DataFrame, pl.LazyFrame]:
+        """
+        Make every part share the first page's schema, so the parts can be scanned
+        together. Columns missing from a page (e.g. all-null JSON fields) are
+        added as nulls.
+        """
+        schema = frame.collect_schema() if isinstance(frame, pl.LazyFrame) else frame.schema
+        if self.schema is None:
+            self.schema = schema
+            return frame
+
+        unexpected = [name for name in schema.names() if name not in self.schema]
+        if unexpected:
+            raise ValueError(
+                f"Page has columns {unexpected} that earlier pages did not. "
+                f"Expected columns: {self.schema.names()}"
+            )
+
+        return frame.select(
+            [
+                pl.col(name).cast(dtype) if name in schema else pl.lit(None, dtype=dtype).alias(name)
+                for name, dtype in self.schema.items()
+            ]
+        )
+
+
+def checkpoint_fingerprint(**query: Any) -> str:
+    """
+    Hash everything that defines a paged pull (endpoint, params, page size, ...)
+    so a checkpoint is only resumed by the exact same query.
+    """
+    payload = json.dumps(query, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
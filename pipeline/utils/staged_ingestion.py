@@ -0,0 +1,156 @@
+# pipeline/utils/staged_ingestion.py
+
+import functools
+import multiprocessing
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+import polars as pl
+
+from pipeline.resources.socrata_resource import decode_page
+
+
+_DONE = object()
+
+
+class _FetchFailed:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def run_staged_ingestion(
+    pages: Iterable[Any],
+    transform: Callable[[Any], Any],
+    parse_workers: int = 2,
+    max_in_flight: int = 4,
+    tagged: bool = False,
+    fetch_buffer: int = 1,
+) -> Iterator[Any]:
+    """
+    Run page ingestion as three overlapping stages and yield transformed pages in order.
+
+      1. Fetch:     a background thread drains `pages` (e.g. SocrataResource.iter_pages)
+                    into a bounded queue.
+      2. Transform: `transform` runs on a process pool, one page per task.
+      3. Write:     the caller's loop over this generator, e.g. ParquetPageWriter.write_page.
+
+    While page N is being written, page N+1 is being transformed and page N+2 is
+    being downloaded. A slow writer or transform stalls the fetcher instead of
+    letting pages pile up in memory. `max_in_flight` caps every page held in
+    memory at once, across all three stages:
+
+      - `fetch_buffer` pages inside `pages` itself, counting the one being
+        handed over (1 for a sequential walk, max_workers for
+        SocrataResource's concurrent pagination, whose fetches run ahead);
+      - one page in the hand-off queue;
+      - the page the caller is writing;
+      - the rest as transforms submitted or finished but not yet written.
+
+    So max_in_flight must be at least fetch_buffer + 2.
+
+    With tagged=True each item of `pages` is a (page, tag) tuple, e.g. the
+    (page, cursor) pairs from SocrataResource.iter_pages(with_cursor=True). Only
+    the page is transformed, and (result, tag) tuples are yielded back.
+
+    `transform` must be picklable (a module-level function or a functools.partial of one).
+    """
+    # The queue is a one-page hand-off; what's left of the budget goes to transforms
+    transform_slots = max_in_flight - fetch_buffer - 1
+    if transform_slots < 1:
+        raise ValueError(
+            f"max_in_flight={max_in_flight} leaves no room for transforms; "
+            f"it must be at least fetch_buffer + 2 = {fetch_buffer + 2}."
+        )
+    fetched = queue.Queue(maxsize=1)
+    stop = threading.Event()
+
+    fetcher = threading.Thread(
+        target=_fetch_stage, args=(pages, fetched, stop), name="staged-ingestion-fetch", daemon=True
+    )
+    fetcher.start()
+
+    # Polars is multi-threaded and not fork-safe, so the workers are spawned
+    mp_context = multiprocessing.get_context("spawn")
+    try:
+        with ProcessPoolExecutor(max_workers=parse_workers, mp_context=mp_context) as pool:
+            pending = deque()
+            while True:
+                item = fetched.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, _FetchFailed):
+                    # Hand over pages already fetched, so they get written and checkpointed
+                    # and a resumed run doesn't fetch them again
+                    while pending:
+                        yield _collect(pending.popleft(), tagged)
+                    raise item.error
+
+                page, tag = item if tagged else (item, None)
+                pending.append((tag, pool.submit(transform, page)))
+                while len(pending) >= transform_slots:
+                    yield _collect(pending.popleft(), tagged)
+
+            while pending:
+                yield _collect(pending.popleft(), tagged)
+    finally:
+        # Unblocks the fetcher if we stopped early or a stage failed
+        stop.set()
+
+
+def decode_and_transform(
+    page: Union[bytes, pl.DataFrame],
+    transform: Callable[[pl.DataFrame], Any],
+    response_format: str = "json",
+    schema: Optional[Dict[str, pl.DataType]] = None,
+) -> Any:
+    """
+    Transform-stage task for Socrata pages: decode a raw page body if needed,
+    then apply `transform`. Bind the arguments with functools.partial before
+    handing it to run_staged_ingestion.
+    """
+    df = page if isinstance(page, pl.DataFrame) else decode_page(page, response_format, schema)
+    return transform(df)
+
+
+def socrata_page_transform(
+    transform: Callable[[pl.DataFrame], Any],
+    response_format: str = "json",
+    schema: Optional[Dict[str, pl.DataType]] = None,
+) -> Callable[[Union[bytes, pl.DataFrame]], Any]:
+    """
+    Build a picklable decode_and_transform task for run_staged_ingestion.
+    """
+    return functools.partial(
+        decode_and_transform, transform=transform, response_format=response_format, schema=schema
+    )
+
+
+def _collect(entry: Tuple[Any, Future], tagged: bool) -> Any:
+    tag, future = entry
+    return (future.result(), tag) if tagged else future.result()
+
+
+def _fetch_stage(pages: Iterable[Any], fetched: queue.Queue, stop: threading.Event) -> None:
+    try:
+        for page in pages:
+            if not _put(fetched, page, stop):
+                return
+        _put(fetched, _DONE, stop)
+    except BaseException as e:
+        _put(fetched, _FetchFailed(e), stop)
+
+
+def _put(fetched: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    """
+    Put with backpressure, giving up once the consumer has stopped.
+    """
+    while not stop.is_set():
+        try:
+            fetched.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
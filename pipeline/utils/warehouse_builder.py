@@ -0,0 +1,390 @@
+# pipeline/utils/warehouse_builder.py
+
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from pipeline.utils.duckdb_wrapper import DuckDBWrapper
+from pipeline.utils.lake_catalog import LakeCatalog
+
+
+# Bookkeeping tables inside the warehouse: one row per lake source we manage, and
+# one per month of each partitioned native table
+SOURCES_TABLE = "_warehouse_sources"
+PARTITIONS_TABLE = "_warehouse_partitions"
+
+# Suffix of the name a source is built under before it's swapped in
+BUILD_SUFFIX = "__building"
+
+# Materialization policies
+VIEW = "view"                  # read_parquet view; always current, re-decodes parquet on every query
+TABLE = "table"                # Native DuckDB table, copied from the lake on each rebuild
+SORTED_TABLE = "sorted_table"  # Native table stored sorted on `sort_by`, so zone maps prune on those keys
+
+# Automatic policy: sources at most this size are copied as soon as any query uses them...
+SMALL_SOURCE_BYTES = 64 * 1024 * 1024
+# ...larger ones once at least this many dbt models / Evidence queries read them
+HOT_SOURCE_REFERENCES = 3
+
+
+class WarehouseSource(NamedTuple):
+    """
+    One lake asset exposed in the warehouse. `base_path` is the asset's
+    directory and `wildcard` selects its files under it. `materialization` is
+    VIEW, TABLE or SORTED_TABLE, or None to choose automatically.
+    """
+    name: str
+    base_path: str
+    wildcard: str
+    partitioned: bool
+    materialization: Optional[str] = None
+    sort_by: Tuple[str, ...] = ()
+
+
+class SourceFile(NamedTuple):
+    """
+    One file of a source, as listed by source_files(). `schema_hash` comes from
+    the lake catalog and is None for files it doesn't know.
+    """
+    path: str
+    bytes: int
+    mtime: float
+    schema_hash: Optional[str] = None
+
+
+def warehouse_sources(
+    single_path_assets: Dict[str, str],
+    partitioned_assets: Dict[str, str],
+    repo_root: str,
+    materializations: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> List[WarehouseSource]:
+    """
+    Build the source list from the {asset_name: path} maps in pipeline/constants.py.
+    Paths are routed through `repo_root` (the warehouse's directory) the same way
+    DuckDBWrapper.bulk_register_* does, so the SQL of each view stays the same.
+
+    `materializations` pins a policy per asset, e.g.
+    {"mta_subway_hourly_ridership": {"materialization": SORTED_TABLE, "sort_by": ["transit_timestamp"]}}.
+    """
+    materializations = materializations or {}
+    sources = []
+    for assets, wildcard, partitioned in (
+        (single_path_assets, "*.parquet", False),
+        (partitioned_assets, "year=*/month=*/*.parquet", True),
+    ):
+        for name, path in assets.items():
+            base_path = os.path.relpath(os.path.dirname(path), repo_root)
+            policy = materializations.get(name, {})
+            sources.append(
+                WarehouseSource(
+                    name,
+                    str(Path(repo_root) / base_path / name),
+                    wildcard,
+                    partitioned,
+                    materialization=policy.get("materialization"),
+                    sort_by=tuple(policy.get("sort_by", ())),
+                )
+            )
+    return sources
+
+
+def query_reference_counts(sql_dirs: List[str], names: List[str]) -> Dict[str, int]:
+    """
+    How many .sql files under `sql_dirs` (dbt models, Evidence sources) mention
+    each source name. Used as the query frequency of a source.
+    """
+    counts = {name: 0 for name in names}
+    patterns = {name: re.compile(rf"\b{re.escape(name)}\b") for name in names}
+    for sql_dir in sql_dirs:
+        for path in glob.glob(os.path.join(sql_dir, "**", "*.sql"), recursive=True):
+            with open(path, encoding="utf-8", errors="replace") as f:
+                sql = f.read()
+            for name, pattern in patterns.items():
+                if pattern.search(sql):
+                    counts[name] += 1
+    return counts
+
+
+def choose_materialization(source: WarehouseSource, total_bytes: int, references: int) -> str:
+    """
+    The source's pinned policy, or else: a view when nothing queries it, a
+    native table when it's small or hot, and a view otherwise. Sorted tables
+    need keys, so they are only used when pinned.
+    """
+    if source.materialization:
+        return source.materialization
+    if references == 0:
+        return VIEW
+    if total_bytes <= SMALL_SOURCE_BYTES or references >= HOT_SOURCE_REFERENCES:
+        return TABLE
+    return VIEW
+
+
+def source_files(source: WarehouseSource, catalog: Optional[LakeCatalog] = None) -> List[SourceFile]:
+    """
+    The source's files, sorted by path. Taken from the lake catalog when it lists
+    the whole asset, so nothing is globbed or stat'ed; otherwise the source's
+    directory is globbed, with schema hashes filled in from the catalog where it
+    has them.
+    """
+    entries = catalog.files(source.name) if catalog is not None else []
+    if catalog is not None and catalog.is_synced(source.name):
+        return [
+            SourceFile(entry["path"], entry["bytes"], entry["mtime"], entry["schema_hash"])
+            for entry in entries
+        ]
+
+    schema_hashes = {os.path.realpath(entry["path"]): entry["schema_hash"] for entry in entries}
+    files = []
+    for path in sorted(glob.glob(os.path.join(source.base_path, source.wildcard))):
+        stat = os.stat(path)
+        files.append(SourceFile(path, stat.st_size, stat.st_mtime, schema_hashes.get(os.path.realpath(path))))
+    return files
+
+
+def source_fingerprint(source: WarehouseSource, files: List[SourceFile], materialization: str = VIEW) -> str:
+    """
+    Hash a source's file set: every file's path with its size, mtime and schema
+    hash. The materialization and sort keys are hashed too, so a policy change
+    rebuilds the object.
+    """
+    base_path = os.path.realpath(source.base_path)
+    payload = json.dumps(
+        {
+            "wildcard": source.wildcard,
+            "materialization": materialization,
+            "sort_by": list(source.sort_by),
+            "files": [
+                [os.path.relpath(os.path.realpath(file.path), base_path), file.bytes, file.mtime, file.schema_hash]
+                for file in files
+            ],
+        }
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def partition_fingerprints(
+    source: WarehouseSource, files: List[SourceFile], materialization: str = VIEW
+) -> Dict[str, str]:
+    """
+    source_fingerprint() per hive partition of a partitioned source, keyed by
+    the partition's path under base_path, e.g. "year=2024/month=01".
+    """
+    by_partition = {}
+    for file in files:
+        by_partition.setdefault(_partition_of(source, file), []).append(file)
+    return {
+        partition: source_fingerprint(source, partition_files, materialization)
+        for partition, partition_files in sorted(by_partition.items())
+    }
+
+
+def refresh_partitions(
+    con,
+    source: WarehouseSource,
+    files: List[SourceFile],
+    changed: List[str],
+    removed: List[str],
+    order_by: Optional[List[str]] = None,
+) -> None:
+    """
+    Bring only some partitions of a partitioned native table up to date: delete
+    the rows of every changed or removed partition, and insert the changed ones
+    again from their files (sorted on `order_by`, if given). Runs inside the
+    caller's transaction; an error (e.g. a month whose columns drifted) leaves
+    it to the caller to roll back and rebuild the whole table.
+
+    With a sorted table, each re-inserted month is sorted on its own and lands
+    at the end of the table, so zone maps still prune within it.
+    """
+    for partition in [*changed, *removed]:
+        values = dict(part.split("=", 1) for part in partition.split("/"))
+        where = " AND ".join(f"{key} = ?" for key in values)
+        con.execute(f"DELETE FROM {source.name} WHERE {where}", [int(value) for value in values.values()])
+
+    for partition in changed:
+        paths = [file.path for file in files if _partition_of(source, file) == partition]
+        path_list = ", ".join("'" + path.replace("'", "''") + "'" for path in paths)
+        query = (
+            f"INSERT INTO {source.name} BY NAME "
+            f"SELECT * FROM read_parquet([{path_list}], hive_partitioning=true, union_by_name=true)"
+        )
+        if order_by:
+            query += f" ORDER BY {', '.join(order_by)}"
+        con.execute(query)
+
+
+def reconcile_warehouse(
+    warehouse_path: str,
+    sources: List[WarehouseSource],
+    catalog: Optional[LakeCatalog] = None,
+    sql_dirs: Optional[List[str]] = None,
+    log: Callable[[str], None] = print,
+) -> Dict[str, Any]:
+    """
+    Bring the DuckDB warehouse in line with the lake without deleting it.
+
+    Each source's files are listed from the lake `catalog` where it covers the
+    asset (see source_files()), and their fingerprint is compared with the one
+    stored in the warehouse's _warehouse_sources table at its last build. Only sources whose
+    fingerprint changed (or whose object is missing) are re-registered with
+    CREATE OR REPLACE. Everything else, including dbt-built tables and views,
+    is left alone, so a no-change run doesn't touch any object.
+
+    A partitioned native table (e.g. the pinned sorted mta_subway_hourly_ridership)
+    isn't copied in full when a month changes: per-month fingerprints in
+    _warehouse_partitions pick out the changed months, and only those are
+    deleted and inserted again, in one transaction. A policy change, or a refresh
+    that fails, rebuilds the whole table.
+
+    Switching a source between a view and a table builds the new object under a
+    temporary name and swaps it in with a DROP and a RENAME in one transaction,
+    so queries never find the source missing and a failed build leaves the old
+    object in place.
+
+    Each source is registered as a view, a native table or a sorted native
+    table, per choose_materialization(). Query frequency comes from how many
+    .sql files under `sql_dirs` reference the source.
+
+    Returns {"rebuilt": [...], "unchanged": [...], "skipped": [...],
+    "materializations": {name: policy}, "refreshed_partitions": {name: [partition, ...]}}.
+    """
+    Path(warehouse_path).parent.mkdir(parents=True, exist_ok=True)
+    duckdb_wrapper = DuckDBWrapper(warehouse_path)
+    con = duckdb_wrapper.con
+    summary = {"rebuilt": [], "unchanged": [], "skipped": [], "materializations": {}, "refreshed_partitions": {}}
+    references = query_reference_counts(sql_dirs or [], [source.name for source in sources])
+
+    try:
+        con.execute(
+            f"CREATE TABLE IF NOT EXISTS {SOURCES_TABLE} "
+            "(name VARCHAR PRIMARY KEY, fingerprint VARCHAR, built_at DOUBLE)"
+        )
+        con.execute(
+            f"CREATE TABLE IF NOT EXISTS {PARTITIONS_TABLE} "
+            "(name VARCHAR, partition_path VARCHAR, fingerprint VARCHAR, PRIMARY KEY (name, partition_path))"
+        )
+        stored = dict(con.execute(f"SELECT name, fingerprint FROM {SOURCES_TABLE}").fetchall())
+        existing = dict(
+            con.execute(
+                "SELECT table_name, table_type FROM information_schema.tables WHERE table_schema = 'main'"
+            ).fetchall()
+        )
+
+        for source in sources:
+            files = source_files(source, catalog)
+            if not files:
+                log(f"Skipping {source.name}: no files found under {source.base_path}")
+                summary["skipped"].append(source.name)
+                continue
+
+            total_bytes = sum(file.bytes for file in files)
+            materialization = choose_materialization(source, total_bytes, references[source.name])
+            if materialization == SORTED_TABLE and not source.sort_by:
+                raise ValueError(f"{source.name}: {SORTED_TABLE} needs sort_by columns")
+            summary["materializations"][source.name] = materialization
+
+            fingerprint = source_fingerprint(source, files, materialization)
+            if stored.get(source.name) == fingerprint and source.name in existing:
+                summary["unchanged"].append(source.name)
+                continue
+
+            order_by = list(source.sort_by) if materialization == SORTED_TABLE else None
+            wanted_type = "VIEW" if materialization == VIEW else "BASE TABLE"
+            partitions = (
+                partition_fingerprints(source, files, materialization)
+                if source.partitioned and materialization != VIEW
+                else {}
+            )
+
+            # A partitioned table that's already there only needs its changed months
+            if partitions and existing.get(source.name) == wanted_type:
+                stored_partitions = dict(
+                    con.execute(
+                        f"SELECT partition_path, fingerprint FROM {PARTITIONS_TABLE} WHERE name = ?", [source.name]
+                    ).fetchall()
+                )
+                changed = [p for p, fp in partitions.items() if stored_partitions.get(p) != fp]
+                removed = [p for p in stored_partitions if p not in partitions]
+                if stored_partitions and len(changed) < len(partitions):
+                    con.begin()
+                    try:
+                        refresh_partitions(con, source, files, changed, removed, order_by)
+                        _record_build(con, source.name, fingerprint, partitions)
+                        con.commit()
+                    except Exception as e:
+                        con.rollback()
+                        log(f"Refreshing {changed + removed} of {source.name} failed ({e}); rebuilding it in full.")
+                    else:
+                        summary["refreshed_partitions"][source.name] = changed + removed
+                        summary["rebuilt"].append(source.name)
+                        continue
+
+            # CREATE OR REPLACE can't turn a view into a table or back, so build under
+            # a temporary name and swap it in
+            swap = existing.get(source.name, wanted_type) != wanted_type
+            build_name = f"{source.name}{BUILD_SUFFIX}" if swap else source.name
+            if swap:
+                con.execute(f"DROP VIEW IF EXISTS {build_name}")
+                con.execute(f"DROP TABLE IF EXISTS {build_name}")
+
+            registered = len(duckdb_wrapper.registered_tables)
+            if source.partitioned and materialization == VIEW:
+                duckdb_wrapper.register_partitioned_data_view(source.base_path, build_name, wildcard=source.wildcard)
+            elif source.partitioned:
+                duckdb_wrapper.register_partitioned_data_table(
+                    source.base_path, build_name, wildcard=source.wildcard, order_by=order_by
+                )
+            elif materialization == VIEW:
+                duckdb_wrapper.register_data_view([Path(source.base_path) / source.wildcard], [build_name])
+            else:
+                duckdb_wrapper.register_data_table(
+                    [Path(source.base_path) / source.wildcard], [build_name], order_by=order_by
+                )
+            if len(duckdb_wrapper.registered_tables) == registered:
+                summary["skipped"].append(source.name)
+                continue
+
+            con.begin()
+            if swap:
+                old_kind = "VIEW" if existing[source.name] == "VIEW" else "TABLE"
+                new_kind = "VIEW" if materialization == VIEW else "TABLE"
+                con.execute(f"DROP {old_kind} {source.name}")
+                con.execute(f"ALTER {new_kind} {build_name} RENAME TO {source.name}")
+            _record_build(con, source.name, fingerprint, partitions)
+            con.commit()
+            summary["rebuilt"].append(source.name)
+    finally:
+        con.close()
+
+    log(
+        f"Warehouse reconciled: {len(summary['rebuilt'])} rebuilt {summary['rebuilt']}, "
+        f"{len(summary['unchanged'])} unchanged, {len(summary['skipped'])} skipped. "
+        f"Partitions refreshed in place: {summary['refreshed_partitions']}. "
+        f"Materializations: {summary['materializations']}"
+    )
+    return summary
+
+
+def _partition_of(source: WarehouseSource, file: SourceFile) -> str:
+    rel_path = os.path.relpath(os.path.realpath(file.path), os.path.realpath(source.base_path))
+    return os.path.dirname(rel_path).replace(os.sep, "/")
+
+
+def _record_build(con, name: str, fingerprint: str, partitions: Dict[str, str]) -> None:
+    """
+    Store a source's fingerprint, and its per-partition fingerprints (none for
+    views and single-path tables), after a build.
+    """
+    con.execute(f"INSERT OR REPLACE INTO {SOURCES_TABLE} VALUES (?, ?, ?)", [name, fingerprint, time.time()])
+    con.execute(f"DELETE FROM {PARTITIONS_TABLE} WHERE name = ?", [name])
+    if partitions:
+        con.executemany(
+            f"INSERT INTO {PARTITIONS_TABLE} VALUES (?, ?, ?)",
+            [[name, partition, partition_fingerprint] for partition, partition_fingerprint in partitions.items()],
+        )
@@ -2,44 +2,79 @@
 # requires-python = ">=3.10"
 # dependencies = [
 #     "polars",
+#     "pyarrow",
 #     "rich",
 # ]
 # ///
 
 
-###Simple helper 
+###Simple helper
+import os
 import sys
 import polars as pl
 from rich.console import Console
 from rich.table import Table
 
+# The repo root, so the lake catalog can be imported when run as a script
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+LAKE_PATH = os.path.join(REPO_ROOT, "data", "opendata")
+
+
+def print_schema(console, columns, title="Parquet Schema"):
+    schema_table = Table(title=title, title_style="bold green")
+    schema_table.add_column("Column Name", justify="left", style="bold yellow", no_wrap=True)
+    schema_table.add_column("Data Type", justify="left", style="bold cyan")
+
+    for col_name, col_dtype in columns:
+        schema_table.add_row(col_name, str(col_dtype), style="white on black")
+
+    console.print(schema_table)
+
+
 def show_parquet_schema(file_path):
     """
-    Reads a Parquet file using Polars and prints its schema 
-    and row count using Rich formatting.
+    Prints a Parquet file's schema and row count using Rich formatting. Only the
+    footer is read, not the data.
     """
     try:
-        df = pl.read_parquet(file_path)
-
+        schema = pl.read_parquet_schema(file_path)
+        row_count = pl.scan_parquet(file_path).select(pl.len()).collect().item()
         console = Console()
-        schema_table = Table(title="Parquet Schema", title_style="bold green")
-        schema_table.add_column("Column Name", justify="left", style="bold yellow", no_wrap=True)
-        schema_table.add_column("Data Type", justify="left", style="bold cyan")
-
-        for col_name, col_dtype in df.schema.items():
-            schema_table.add_row(col_name, str(col_dtype), style="white on black")
-
-        console.print(schema_table)
-        console.print(f"[bold magenta]\nNumber of rows:[/] [bold white]{df.height}[/]")
-    
+        print_schema(console, schema.items())
+        console.print(f"[bold magenta]\nNumber of rows:[/] [bold white]{row_count}[/]")
     except Exception as e:
         console = Console()
         console.print(f"[bold red]Error:[/] {str(e)}")
 
+
+def show_asset_schema(asset_name):
+    """
+    Prints a lake asset's schema(s) and row count from the lake catalog, without
+    opening any of its files. More than one schema means the files have drifted.
+    """
+    sys.path.insert(0, REPO_ROOT)
+    from pipeline.utils.lake_catalog import LakeCatalog
+
+    console = Console()
+    catalog = LakeCatalog(LAKE_PATH)
+    schemas = catalog.schemas(asset_name)
+    if not schemas:
+        console.print(f"[bold red]Error:[/] No catalog entries for asset '{asset_name}'")
+        return
+
+    for schema_hash, columns in schemas.items():
+        title = f"{asset_name} schema {schema_hash[:12]}" if len(schemas) > 1 else f"{asset_name} schema"
+        print_schema(console, columns, title=title)
+    console.print(f"[bold magenta]\nNumber of rows:[/] [bold white]{catalog.row_count(asset_name)}[/]")
+
+
 if __name__ == "__main__":
     if len(sys.argv) != 2:
-        print("Usage: python show_parquet_schema.py <path_to_parquet_file>")
+        print("Usage: python sp.py <path_to_parquet_file | lake_asset_name>")
         sys.exit(1)
-    
-    file_path = sys.argv[1]
-    show_parquet_schema(file_path)
+
+    target = sys.argv[1]
+    if os.path.isfile(target):
+        show_parquet_schema(target)
+    else:
+        show_asset_schema(target)